@@ -0,0 +1,480 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import solver
+import synthTree
+from gameState import gameState
+from taxDump import iterNames, iterNodes
+from treeGen import taxName, taxNode, treeNode
+
+# Real NCBI ranks, so rank columns look like the real thing
+dmpRanks = [
+    "no rank",
+    "superkingdom",
+    "phylum",
+    "class",
+    "order",
+    "family",
+    "genus",
+    "species",
+]
+
+
+def writeSyntheticDump(directory: str, numNodes: int, seed: int = 0) -> tuple[str, str]:
+    """Write a random names.dmp and nodes.dmp with the real files' layout
+
+    Args:
+        directory (str): The directory to write to
+        numNodes (int): The number of nodes, the real nodes.dmp has about 2.6 million
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        tuple[str, str]: The paths to names.dmp and nodes.dmp
+    """
+    rng = random.Random(seed)
+    namesPath = os.path.join(directory, "names.dmp")
+    nodesPath = os.path.join(directory, "nodes.dmp")
+    with open(nodesPath, "w") as nodes, open(namesPath, "w") as names:
+        for tax_id in range(1, numNodes + 1):
+            parent = (
+                1 if tax_id == 1 else rng.randint(max(1, tax_id - 1000), tax_id - 1)
+            )
+            rank = dmpRanks[min(len(dmpRanks) - 1, tax_id.bit_length() // 3)]
+            nodes.write(
+                str(tax_id)
+                + "\t|\t"
+                + str(parent)
+                + "\t|\t"
+                + rank
+                + "\t|\tXX\t|\t1\t|\t1\t|\t1\t|\t1\t|\t2\t|\t1\t|\t0\t|\t0\t|\t\t|\n"
+            )
+            names.write(
+                str(tax_id)
+                + "\t|\tGenus"
+                + str(tax_id)
+                + " species\t|\t\t|\tscientific name\t|\n"
+            )
+            # Roughly half of the real nodes have a synonym or common name too
+            if rng.random() < 0.5:
+                names.write(
+                    str(tax_id)
+                    + "\t|\tcommon thing "
+                    + str(tax_id)
+                    + "\t|\t\t|\tgenbank common name\t|\n"
+                )
+    return namesPath, nodesPath
+
+
+def timeRows(rows) -> tuple[int, float]:
+    """Time how long it takes to exhaust an iterable
+
+    Args:
+        rows (_type_): The iterable
+
+    Returns:
+        tuple[int, float]: The number of items and the seconds taken
+    """
+    start = time.perf_counter()
+    count = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in rows:
+            count = count + 1
+    return count, time.perf_counter() - start
+
+
+def linesAs(path: str, cls):
+    with open(path) as file:
+        for line in file:
+            yield cls(line)
+
+
+def syntheticLineages(numSpecies: int, seed: int = 0) -> list[list[int]]:
+    """Make root-first tax_id chains for species in a made up taxonomy
+
+    Every species shares a long stem like the real tree's root to Metazoa, then
+    is grouped into genera of up to 20 species, families of up to 10 genera and
+    so on, so some nodes have many children.
+
+    Args:
+        numSpecies (int): The number of species
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        list[list[int]]: A tax_id chain for each species
+    """
+    rng = random.Random(seed)
+    stem = list(range(1, 21))
+    lineages = []
+    for species in range(numSpecies):
+        chain = list(stem)
+        group = species
+        groupIds = []
+        for width, level in ((20, 1), (10, 2), (10, 3), (10, 4)):
+            group = group // width
+            groupIds.append(level * 100000000 + group)
+        chain.extend(reversed(groupIds))
+        chain.append(1000000000 + species)
+        lineages.append(chain)
+    rng.shuffle(lineages)
+    return lineages
+
+
+def benchTreeGen(args):
+    """Time building, naming and writing trees of growing size, to show it scales linearly"""
+    print("species, build, name, dot, json, total, us/species")
+    for numSpecies in args.sizes:
+        lineages = syntheticLineages(numSpecies)
+        nameDict = {t: "Clade" + str(t) for chain in lineages for t in chain}
+        speciesNames = {chain[-1]: "species " + str(chain[-1]) for chain in lineages}
+
+        times = []
+        start = time.perf_counter()
+        root = treeNode(1)
+        for chain in lineages:
+            root.addToTree(chain)
+        times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        root.addNamesToTree(nameDict, speciesNames)
+        times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        root.printTreeDot(io.StringIO(), speciesNames)
+        times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        root.printTreeJson(io.StringIO())
+        times.append(time.perf_counter() - start)
+
+        total = sum(times)
+        print(
+            str(numSpecies)
+            + ", "
+            + ", ".join("{0:0.3f}s".format(t) for t in times)
+            + ", {0:0.3f}s, {1:0.1f}".format(total, 1000000 * total / numSpecies)
+        )
+
+
+def benchDmp(args):
+    """Compare the per-line regex classes to the chunked parser on a synthetic dump"""
+    with tempfile.TemporaryDirectory() as directory:
+        print("Writing a synthetic dump with " + str(args.nodes) + " nodes")
+        namesPath, nodesPath = writeSyntheticDump(directory, args.nodes)
+
+        for label, path, slow, fast in (
+            (
+                "names.dmp",
+                namesPath,
+                linesAs(namesPath, taxName),
+                iterNames(namesPath, None),
+            ),
+            ("nodes.dmp", nodesPath, linesAs(nodesPath, taxNode), iterNodes(nodesPath)),
+        ):
+            slowRows, slowTime = timeRows(slow)
+            fastRows, fastTime = timeRows(fast)
+            assert slowRows == fastRows
+            print(
+                "{0}: {1} rows, classes {2:0.2f}s, parser {3:0.2f}s, {4:0.1f}x faster".format(
+                    label, slowRows, slowTime, fastTime, slowTime / fastTime
+                )
+            )
+
+
+def syntheticTree(numSpecies: int, seed: int = 0) -> str:
+    """Make a tree in tree.json's format with synthTree, fitted to tree.json
+
+    Args:
+        numSpecies (int): The number of species
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        str: The tree's JSON
+    """
+    profileFor = synthTree.fittedSource(
+        solver.loadGame("tree.json").index, random.Random(seed)
+    )
+    file = io.StringIO()
+    synthTree.writeTree(file, numSpecies, profileFor)
+    return file.getvalue()
+
+
+def timeCalls(func, argsList: list) -> dict:
+    """Time a function over a list of arguments, one call each
+
+    Args:
+        func (_type_): The function to time
+        argsList (list): A tuple of arguments for each call
+
+    Returns:
+        dict: The number of calls, and the mean and max microseconds per call
+    """
+    times = []
+    for args in argsList:
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return {
+        "calls": len(times),
+        "meanUs": 1000000 * sum(times) / len(times) if times else 0,
+        "maxUs": 1000000 * max(times) if times else 0,
+    }
+
+
+def peakMemory(func, *args) -> int:
+    """Get the most memory a call allocates at once
+
+    Args:
+        func (_type_): The function to call
+
+    Returns:
+        int: The peak traced bytes
+    """
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def simulate(state: gameState, speciesList: list[str], strategy) -> dict:
+    """Solve for every species in a list, timing each decision
+
+    Args:
+        state (gameState): The starting state
+        speciesList (list[str]): The species to solve for, all in the tree
+        strategy (_type_): The strategy to time
+
+    Returns:
+        dict: The mean guesses, the wall time, and the first and later decision times
+    """
+    decisions = []
+
+    def timedStrategy(s: gameState) -> str:
+        start = time.perf_counter()
+        guess = strategy(s)
+        decisions.append(
+            (s.root == state.root and not s.culled, time.perf_counter() - start)
+        )
+        return guess
+
+    # The first call may build caches, like the exhaustive engine's matrices
+    start = time.perf_counter()
+    strategy(state)
+    setup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    guesses = [
+        solver.solveForSpecies(state, species, timedStrategy) for species in speciesList
+    ]
+    wall = time.perf_counter() - start
+
+    later = [t for first, t in decisions if not first]
+    first = [t for isFirst, t in decisions if isFirst]
+    return {
+        "species": len(speciesList),
+        "meanGuesses": sum(guesses) / len(guesses),
+        "maxGuesses": max(guesses),
+        "seconds": wall,
+        "firstCallUs": 1000000 * setup,
+        "firstDecisionUs": 1000000 * sum(first) / len(first),
+        "laterDecisions": len(later),
+        "laterDecisionUs": 1000000 * sum(later) / len(later) if later else 0,
+    }
+
+
+def benchTree(label: str, loadTree, speciesList: list[str], args) -> dict:
+    """Benchmark loading, the tree operations and every strategy on one tree
+
+    Args:
+        label (str): What to call the tree in the results
+        loadTree (_type_): Returns a fresh copy of the tree's root dict
+        speciesList (list[str]): The species to simulate games for, up to --sample of them
+        args (_type_): The command line arguments
+
+    Returns:
+        dict: The results for this tree
+    """
+    rng = random.Random(0)
+    result = {"tree": label}
+
+    start = time.perf_counter()
+    tree = loadTree()
+    result["loadSeconds"] = time.perf_counter() - start
+    start = time.perf_counter()
+    state = solver.newGame(tree)
+    result["indexSeconds"] = time.perf_counter() - start
+    idx = state.index
+    result["leaves"] = state.count
+    result["nodes"] = len(idx.names)
+
+    speciesList = [s for s in speciesList if -1 != idx.find(s, exact=True)]
+    sample = rng.sample(speciesList, min(len(speciesList), args.sample))
+    groups = [
+        idx.names[i]
+        for i in rng.sample(range(len(idx.names)), min(len(idx.names), args.sample))
+    ]
+    pairs = [(tree, a, b) for a, b in zip(sample, reversed(sample))]
+
+    # The dict API used before the index, on the same compiled tree
+    ops = {
+        "newRoot": timeCalls(solver.newRoot, [(tree, g) for g in groups]),
+        "findSpecies": timeCalls(solver.findSpecies, [(tree, s) for s in sample]),
+        "findCommonGroup": timeCalls(solver.findCommonGroup, pairs),
+    }
+    # cullGroup changes the tree, so it gets its own copy, culling each species once
+    culled = loadTree()
+    solver.newGame(culled)
+    ops["cullGroup"] = timeCalls(solver.cullGroup, [(culled, s) for s in sample])
+    result["ops"] = ops
+    # Only after the ops, since compiling another tree replaces the one they use
+    result["peakLoadBytes"] = peakMemory(lambda: solver.newGame(loadTree()))
+
+    result["strategies"] = {}
+    for name in args.strategies:
+        if "exhaustive" == name and args.exhaustive_limit < state.count:
+            result["strategies"][name] = {
+                "skipped": "more than --exhaustive-limit leaves"
+            }
+            continue
+        strategy = solver.strategies[name]
+        stats = simulate(state, sample, strategy)
+        stats["peakDecisionBytes"] = peakMemory(strategy, state)
+        result["strategies"][name] = stats
+        print(
+            "{0}: {1} {2:0.3f} avg, {3:0.3f}s, first {4:0.0f}us, then {5:0.0f}us per decision".format(
+                label,
+                name,
+                stats["meanGuesses"],
+                stats["seconds"],
+                stats["firstDecisionUs"],
+                stats["laterDecisionUs"],
+            )
+        )
+    return result
+
+
+def gitCommit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchSolver(args):
+    """Time every strategy and tree operation on the game trees and synthetic ones, and save the results"""
+    results = {
+        "commit": gitCommit(),
+        "python": platform.python_version(),
+        "numpy": solver.exhaustiveEngine is not None,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "trees": [],
+    }
+
+    for game in args.games:
+        treeFile, speciesFile = solver.gameFiles[game]
+        with open(speciesFile) as file:
+            speciesList = json.load(file)["species"]
+
+        def loadTree(treeFile=treeFile):
+            with open(treeFile) as file:
+                return json.load(file)
+
+        # The whole corpus, however big --sample is
+        gameArgs = argparse.Namespace(**vars(args))
+        gameArgs.sample = max(args.sample, len(speciesList))
+        results["trees"].append(benchTree(treeFile, loadTree, speciesList, gameArgs))
+
+    for numSpecies in args.sizes:
+        data = syntheticTree(numSpecies)
+        speciesList = list(solver.getAllSpecies(json.loads(data)))
+        results["trees"].append(
+            benchTree(
+                "synthetic-" + str(numSpecies),
+                lambda: json.loads(data),
+                speciesList,
+                args,
+            )
+        )
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print("Wrote " + args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks for the solver and tree generator"
+    )
+    subparsers = parser.add_subparsers(required=True)
+
+    dmpParser = subparsers.add_parser("dmp", help="taxdump parsing")
+    dmpParser.add_argument(
+        "--nodes", type=int, default=2600000, help="synthetic dump size"
+    )
+    dmpParser.set_defaults(func=benchDmp)
+
+    treeGenParser = subparsers.add_parser("treegen", help="tree construction scaling")
+    treeGenParser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 4000, 16000, 64000],
+        help="species counts to build trees for",
+    )
+    treeGenParser.set_defaults(func=benchTreeGen)
+
+    solverParser = subparsers.add_parser(
+        "solver", help="strategies and tree operations"
+    )
+    solverParser.add_argument(
+        "--games",
+        nargs="*",
+        choices=solver.gameFiles.keys(),
+        default=list(solver.gameFiles.keys()),
+        help="game trees to run on",
+    )
+    solverParser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="*",
+        default=[1000, 10000, 100000],
+        help="species counts of synthetic trees to run on",
+    )
+    solverParser.add_argument(
+        "--strategies",
+        nargs="+",
+        choices=solver.strategies.keys(),
+        default=["largest", "half", "entropy", "exhaustive"],
+        help="strategies to time",
+    )
+    solverParser.add_argument(
+        "--sample",
+        type=int,
+        default=200,
+        help="species to simulate games for and run each operation on, per synthetic tree, game trees use every species",
+    )
+    solverParser.add_argument(
+        "--exhaustive-limit",
+        type=int,
+        default=1000,
+        help="skip the exhaustive strategy on trees with more leaves, its memory is quadratic",
+    )
+    solverParser.add_argument(
+        "--output", default="benchmark-solver.json", help="file to write the results to"
+    )
+    solverParser.set_defaults(func=benchSolver)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,324 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+
+from solver import gameFiles, sciNameFiles
+from taxDump import isCacheCurrent, openTaxCache, resolveMatches, sourceStamps
+from treeGen import fixSciName, speciesByTaxId, treeNode
+from treeIndex import treeIndex
+
+# Bump when the manifest's layout, or how the tree is built from it, changes
+MANIFEST_VERSION = 1
+
+
+def hashFile(filename: str) -> str:
+    """Hash a file without reading it all into memory
+
+    Args:
+        filename (str): The file
+
+    Returns:
+        str: The SHA-256 of its contents, in hex
+    """
+    sha = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def manifestFilename(treeFile: str) -> str:
+    """Get the file a tree's build manifest is kept in, i.e. tree.json -> tree.manifest.json
+
+    Args:
+        treeFile (str): The tree file
+
+    Returns:
+        str: The manifest's filename
+    """
+    return os.path.splitext(treeFile)[0] + ".manifest.json"
+
+
+def loadManifest(filename: str) -> dict:
+    try:
+        with open(filename) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if MANIFEST_VERSION != manifest.get("version"):
+        return None
+    return manifest
+
+
+def dumpHashes(namesPath: str, nodesPath: str, previous: dict) -> dict:
+    """Hash the taxdump, reusing the last build's hashes for files that haven't been touched
+
+    The dumps are gigabytes, so they're only read again when their size or
+    modification time changed.
+
+    Args:
+        namesPath (str): The path to names.dmp
+        nodesPath (str): The path to nodes.dmp
+        previous (dict): The last build's hashes, from its manifest
+
+    Returns:
+        dict: [size, mtime_ns, hash] for each file by name, or the previous
+            hashes if the dumps were deleted after the cache was built
+    """
+    if not (os.path.exists(namesPath) and os.path.exists(nodesPath)):
+        return previous
+    hashes = {}
+    for name, stamp in sourceStamps(namesPath, nodesPath).items():
+        path = namesPath if name == os.path.basename(namesPath) else nodesPath
+        old = previous.get(name)
+        if old is not None and old[:2] == stamp:
+            hashes[name] = old
+        else:
+            print("Hashing " + path)
+            hashes[name] = stamp + [hashFile(path)]
+    return hashes
+
+
+def resolveSpecies(
+    cache, sciNames: list[str]
+) -> tuple[dict[str, list[int]], dict[int, str], list[str], dict]:
+    """Find the lineage of each species in the taxdump cache, all in one batch
+
+    Args:
+        cache (taxCache): The opened cache
+        sciNames (list[str]): The species' scientific names, as metazooa knows them
+
+    Returns:
+        tuple[dict[str, list[int]], dict[int, str], list[str], dict]: The tax_ids from
+            the root down to each species found, by scientific name, the scientific
+            name of every node in them, the names not found, and the candidates of
+            names that matched several nodes
+    """
+    resolved, unresolved, ambiguous = resolveMatches(cache.matchNames(sciNames))
+    lineages = {}
+    names = {}
+    for sciName, tax_id in resolved.items():
+        lineage = cache.lineage(tax_id)
+        lineages[sciName] = lineage
+        names.update(
+            {t: fixSciName(cache.sciName(t)) for t in lineage if t not in names}
+        )
+    return lineages, names, unresolved, ambiguous
+
+
+def buildTree(
+    mzNames: dict, records: dict, names: dict[int, str]
+) -> tuple[treeNode, dict[int, str]]:
+    """Build the tree from the resolved lineages, exactly as treeGen.py would
+
+    Args:
+        mzNames (dict): The JSON object of metazooa names, in the order they're added
+        records (dict): The resolved lineage of each species, by name
+        names (dict[int, str]): The scientific name of every node in a lineage
+
+    Returns:
+        tuple[treeNode, dict[int, str]]: The named tree, and the metazooa name of each species by tax_id
+    """
+    root = treeNode(1)
+    linked = []
+    for mzSpecies in mzNames["species"]:
+        record = records.get(mzSpecies["name"])
+        if record is not None:
+            root.addToTree(record["lineage"])
+            linked.append({"name": mzSpecies["name"], "tax_id": record["lineage"][-1]})
+    speciesNames = speciesByTaxId({"species": linked})
+    root.addNamesToTree(names, speciesNames)
+    return root, speciesNames
+
+
+def build(game: str, args) -> bool:
+    """Bring a game's tree up to date with its inputs, redoing only what changed
+
+    Args:
+        game (str): "metazooa" or "metaflora"
+        args (_type_): The command line arguments
+
+    Returns:
+        bool: True if every species with a scientific name was found in the taxdump
+    """
+    start = time.perf_counter()
+    treeFile, speciesFile = gameFiles[game]
+    sciNamesFile = sciNameFiles[game]
+    manifestFile = manifestFilename(treeFile)
+    manifest = None if args.force else loadManifest(manifestFile)
+    if manifest is None:
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "inputs": {},
+            "species": {},
+            "names": {},
+        }
+    inputs = manifest["inputs"]
+
+    # Nothing to do if no input changed and the outputs are the ones last built
+    sciNamesHash = hashFile(sciNamesFile)
+    speciesHash = hashFile(speciesFile) if os.path.exists(speciesFile) else None
+    hashes = dumpHashes(args.names, args.nodes, inputs.get("taxdump", {}))
+    binFile = os.path.splitext(treeFile)[0] + ".bin"
+    if (
+        not args.dot
+        and sciNamesHash == inputs.get("sciNames")
+        and speciesHash == inputs.get("species")
+        and hashes == inputs.get("taxdump")
+        and os.path.exists(treeFile)
+        and hashFile(treeFile) == manifest.get("tree")
+        and os.path.exists(binFile)
+        and treeIndex.fromBinary(binFile, bytes.fromhex(manifest["tree"])) is not None
+    ):
+        for name in manifest.get("unresolved", []):
+            print(name + " was not found in the taxdump, left out")
+        print(
+            treeFile + " is up to date ({0:0.3f}s)".format(time.perf_counter() - start)
+        )
+        return not manifest.get("unresolved")
+
+    with open(sciNamesFile) as file:
+        mzNames = json.load(file)
+    sciNames = {s["name"]: s["sciName"] for s in mzNames["species"]}
+
+    # Species in the game without a scientific name need sciScraper.py first
+    if os.path.exists(speciesFile):
+        with open(speciesFile) as file:
+            unscraped = [s for s in json.load(file)["species"] if s not in sciNames]
+        if unscraped:
+            print(
+                str(len(unscraped))
+                + " species have no scientific name in "
+                + sciNamesFile
+                + ", run sciScraper.py: "
+                + ", ".join(unscraped)
+            )
+
+    # A different taxdump can change any lineage, so everything is resolved again
+    if hashes != inputs.get("taxdump"):
+        if inputs.get("taxdump"):
+            print("Taxdump changed, resolving every species again")
+        manifest["species"] = {}
+        manifest["names"] = {}
+    inputs["taxdump"] = hashes
+
+    # Only species that are new, or whose scientific name changed, are looked up
+    records: dict = manifest["species"]
+    for name in list(records.keys()):
+        if sciNames.get(name) != records[name]["sciName"]:
+            del records[name]
+    toResolve = [name for name in sciNames.keys() if name not in records]
+    unresolved = []
+    if toResolve:
+        if not (
+            isCacheCurrent(args.names, args.nodes, args.cache_dir)
+            or (os.path.exists(args.names) and os.path.exists(args.nodes))
+        ):
+            raise FileNotFoundError(
+                "need "
+                + args.names
+                + " and "
+                + args.nodes
+                + " to resolve "
+                + str(len(toResolve))
+                + " species"
+            )
+        cache = openTaxCache(args.names, args.nodes, args.cache_dir)
+        lineages, lineageNames, _, ambiguous = resolveSpecies(
+            cache, [sciNames[name] for name in toResolve]
+        )
+        for name in toResolve:
+            if sciNames[name] not in lineages:
+                unresolved.append(name)
+                continue
+            records[name] = {
+                "sciName": sciNames[name],
+                "lineage": lineages[sciNames[name]],
+            }
+            if sciNames[name] in ambiguous:
+                print(
+                    name
+                    + " ("
+                    + sciNames[name]
+                    + ") matches tax_ids "
+                    + ", ".join(str(t) for t in ambiguous[sciNames[name]])
+                    + ", using the first"
+                )
+        # JSON keys are strings
+        manifest["names"].update({str(t): n for t, n in lineageNames.items()})
+        print("Resolved " + str(len(toResolve) - len(unresolved)) + " species")
+    for name in unresolved:
+        print(name + " (" + sciNames[name] + ") was not found in the taxdump, left out")
+
+    names = {int(t): n for t, n in manifest["names"].items()}
+    root, speciesNames = buildTree(mzNames, records, names)
+    file = io.StringIO()
+    root.printTreeJson(file)
+    treeData = file.getvalue().encode()
+    treeHash = hashlib.sha256(treeData).digest()
+
+    # Only write files whose contents would change, so the solver's cached books stay valid
+    if not os.path.exists(treeFile) or hashFile(treeFile) != treeHash.hex():
+        with open(treeFile, "wb") as file:
+            file.write(treeData)
+        print("Wrote " + treeFile)
+    if not os.path.exists(binFile) or treeIndex.fromBinary(binFile, treeHash) is None:
+        root.toIndex().writeBinary(binFile, treeHash)
+        print("Wrote " + binFile)
+    if args.dot:
+        with open("tree.dot", "w") as file:
+            file.write("digraph g {\n")
+            root.printTreeDot(file, speciesNames)
+            file.write("}\n")
+
+    # Names of nodes no longer in any lineage are dropped
+    inTree = {str(t) for record in records.values() for t in record["lineage"]}
+    manifest["names"] = {t: n for t, n in manifest["names"].items() if t in inTree}
+    inputs["sciNames"] = sciNamesHash
+    inputs["species"] = speciesHash
+    manifest["tree"] = treeHash.hex()
+    manifest["unresolved"] = unresolved
+    tmpFile = manifestFile + ".tmp"
+    with open(tmpFile, "w") as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(tmpFile, manifestFile)
+
+    print(treeFile + " is up to date ({0:0.3f}s)".format(time.perf_counter() - start))
+    return not unresolved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build tree.json and tree.bin from the species' scientific names, redoing only what changed"
+    )
+    parser.add_argument(
+        "args", nargs="*", help='"metaflora" to build Metaflora\'s tree, "all" for both'
+    )
+    parser.add_argument("--names", default="names.dmp", help="the path to names.dmp")
+    parser.add_argument("--nodes", default="nodes.dmp", help="the path to nodes.dmp")
+    parser.add_argument(
+        "--cache-dir", default="taxcache", help="the taxdump cache directory"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="ignore the manifest and rebuild everything",
+    )
+    parser.add_argument("--dot", action="store_true", help="also write tree.dot")
+    args = parser.parse_args()
+    words = [word.lower() for word in args.args]
+
+    if "all" in words:
+        games = list(gameFiles.keys())
+    elif "metaflora" in words:
+        games = ["metaflora"]
+    else:
+        games = ["metazooa"]
+    ok = True
+    for game in games:
+        ok = build(game, args) and ok
+    if not ok:
+        raise SystemExit(1)
@@ -0,0 +1,107 @@
+import numpy as np
+
+from gameState import gameState
+from treeIndex import treeIndex
+
+
+class exhaustiveEngine:
+    """Vectorized scoring for the exhaustive strategy
+
+    For every (guess, answer) pair of species the clue is fixed by the tree: the
+    common group is their LCA and the culled branch is the LCA's child leading
+    to the guess. Both are precomputed into species x species matrices, so
+    scoring a candidate set is two gathers from a per-node count vector.
+    """
+
+    # Engines built so far, keyed by id() of their index. The index is kept
+    # alongside so the id stays valid
+    _engines: dict = {}
+
+    def __init__(self, index: treeIndex) -> None:
+        """Precompute the clue matrices for a tree
+
+        Args:
+            index (treeIndex): The tree to precompute for
+        """
+        self.index = index
+        numSpecies = len(index.leaves)
+        # Node index.n is a sentinel with a count of zero, for "nothing culled"
+        self.sentinel = index.n
+        self.leafLo = np.array(index.leafLo, dtype=np.int64)
+        self.leafHi = np.array(index.leafHi, dtype=np.int64)
+
+        self.groupIds = np.empty((numSpecies, numSpecies), dtype=np.int32)
+        self.cullIds = np.empty((numSpecies, numSpecies), dtype=np.int32)
+        for rank, leaf in enumerate(index.leaves):
+            # Walk down from the root, each deeper ancestor overwrites the answers under it
+            path = index.path(0, leaf)
+            for depth, node in enumerate(path):
+                lo = index.leafLo[node]
+                hi = index.leafHi[node]
+                self.groupIds[rank, lo:hi] = node
+                if node == leaf:
+                    self.cullIds[rank, lo:hi] = self.sentinel
+                else:
+                    self.cullIds[rank, lo:hi] = path[depth + 1]
+
+    @classmethod
+    def forIndex(cls, index: treeIndex):
+        """Get the engine for a tree, building it the first time
+
+        Args:
+            index (treeIndex): The tree to score on
+
+        Returns:
+            exhaustiveEngine: The engine for this tree
+        """
+        cached = cls._engines.get(id(index))
+        if cached is None or cached[0] is not index:
+            cached = (index, cls(index))
+            cls._engines[id(index)] = cached
+        return cached[1]
+
+    def nodeCounts(self, state: gameState) -> np.ndarray:
+        """Count the candidates under every node
+
+        Args:
+            state (gameState): The candidates
+
+        Returns:
+            np.ndarray: The count for each node ID, plus a trailing zero for the sentinel
+        """
+        live = np.zeros(len(self.index.leaves) + 1, dtype=np.int64)
+        for lo, hi in state.intervals():
+            live[lo + 1 : hi + 1] = 1
+        prefix = np.cumsum(live)
+        counts = np.zeros(self.index.n + 1, dtype=np.int64)
+        counts[:-1] = prefix[self.leafHi] - prefix[self.leafLo]
+        return counts
+
+    def totalRemaining(self, state: gameState, guesses: np.ndarray) -> np.ndarray:
+        """Sum the candidates left over every possible answer, for each guess
+
+        Args:
+            state (gameState): The candidates, which are also the possible answers
+            guesses (np.ndarray): Leaf ranks of the guesses to score
+
+        Returns:
+            np.ndarray: The total candidates remaining for each guess
+        """
+        counts = self.nodeCounts(state)
+        answers = np.concatenate([np.arange(lo, hi) for lo, hi in state.intervals()])
+        rows = np.ix_(guesses, answers)
+        remaining = counts[self.groupIds[rows]] - counts[self.cullIds[rows]]
+        return remaining.sum(axis=1)
+
+    def bestGuess(self, state: gameState) -> int:
+        """Find the candidate which leaves the fewest candidates on average
+
+        Args:
+            state (gameState): The candidates to guess from
+
+        Returns:
+            int: The leaf ID to guess, the first in tree order on ties
+        """
+        guesses = np.concatenate([np.arange(lo, hi) for lo, hi in state.intervals()])
+        totals = self.totalRemaining(state, guesses)
+        return self.index.leaves[int(guesses[np.argmin(totals)])]
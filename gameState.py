@@ -0,0 +1,188 @@
+from treeIndex import treeIndex
+
+
+class gameState:
+    """The species still possible in a game, as a view over a shared read-only tree
+
+    Every clue narrows the game to the subtree of the common group, minus the
+    branch of that group leading to the incorrect guess. So the candidates are
+    always one root node with some of its children culled, which is all this
+    stores. States are never modified, applying a clue returns a new one.
+    """
+
+    __slots__ = ("index", "root", "culled", "count")
+
+    def __init__(
+        self, index: treeIndex, root: int = 0, culled: tuple = (), count: int = None
+    ) -> None:
+        """Initialize a game state
+
+        Args:
+            index (treeIndex): The tree the game is played on
+            root (int, optional): The node all candidates are under. Defaults to 0.
+            culled (tuple, optional): Children of root that were ruled out, sorted. Defaults to ().
+            count (int, optional): The number of candidates, if already known. Defaults to None.
+        """
+        self.index = index
+        self.root = root
+        self.culled = culled
+        if count is None:
+            count = index.leafCount[root]
+            for c in culled:
+                count = count - index.leafCount[c]
+        self.count = count
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, gameState)
+            and self.index is other.index
+            and self.root == other.root
+            and self.culled == other.culled
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.root, self.culled))
+
+    def __repr__(self) -> str:
+        return (
+            "gameState("
+            + self.index.names[self.root]
+            + ", culled="
+            + str([self.index.names[c] for c in self.culled])
+            + ", count="
+            + str(self.count)
+            + ")"
+        )
+
+    def isSolved(self) -> bool:
+        return 1 == self.count
+
+    def contains(self, node: int) -> bool:
+        """Check if a node is still in play
+
+        Args:
+            node (int): The node ID to check
+
+        Returns:
+            bool: True if the node is under the root and not in a culled branch
+        """
+        if not self.index.contains(self.root, node):
+            return False
+        for c in self.culled:
+            if self.index.contains(c, node):
+                return False
+        return True
+
+    def findSpecies(self, name: str) -> int:
+        """Find a species still in play by name, as a player would type it
+
+        Species can share a name with their genus, i.e. "gorilla", so only
+        leaves in play are matched, and one with the same case first.
+
+        Args:
+            name (str): The species name, case-insensitive
+
+        Returns:
+            int: The leaf ID, or -1 if no species in play has the name
+        """
+        idx = self.index
+        inPlay = [
+            i
+            for i in idx.nameToIds.get(name.lower(), ())
+            if idx.isLeaf(i) and self.contains(i)
+        ]
+        for i in inPlay:
+            if idx.names[i] == name:
+                return i
+        return inPlay[0] if inPlay else -1
+
+    def countOf(self, node: int) -> int:
+        """Count the candidate species under a node
+
+        Args:
+            node (int): The node ID to count under
+
+        Returns:
+            int: The number of candidates in the node's subtree
+        """
+        idx = self.index
+        count = idx.leafCount[node]
+        for c in self.culled:
+            if idx.contains(c, node):
+                return 0
+            if idx.contains(node, c):
+                count = count - idx.leafCount[c]
+        return count
+
+    def children(self, node: int):
+        """Iterate over the children of a node that are still in play
+
+        Args:
+            node (int): The node ID, which must be in play
+
+        Yields:
+            int: Each child ID, in tree order
+        """
+        for child in self.index.children(node):
+            if child not in self.culled:
+                yield child
+
+    def intervals(self) -> list[tuple[int, int]]:
+        """Get the candidates as sorted, disjoint leaf rank intervals
+
+        Returns:
+            list[tuple[int, int]]: Half-open [lo, hi) ranges into index.leaves
+        """
+        idx = self.index
+        ranges = []
+        lo = idx.leafLo[self.root]
+        for c in self.culled:
+            if lo < idx.leafLo[c]:
+                ranges.append((lo, idx.leafLo[c]))
+            lo = idx.leafHi[c]
+        if lo < idx.leafHi[self.root]:
+            ranges.append((lo, idx.leafHi[self.root]))
+        return ranges
+
+    def species(self) -> list[int]:
+        """Get the IDs of all candidate species
+
+        Returns:
+            list[int]: The leaf IDs still in play, in tree order
+        """
+        leaves = self.index.leaves
+        return [leaf for lo, hi in self.intervals() for leaf in leaves[lo:hi]]
+
+    def applyClue(self, guess: int, group: int):
+        """Narrow the game with the common group reported for an incorrect guess
+
+        Args:
+            guess (int): The leaf ID that was guessed
+            group (int): The node ID of the reported common group
+
+        Raises:
+            ValueError: If the group isn't in play
+
+        Returns:
+            gameState: The state after the clue
+        """
+        idx = self.index
+        if not self.contains(group):
+            raise ValueError(idx.names[group] + " is not in play")
+
+        # Below the root nothing has been culled yet, so every leaf under the group is in play
+        if group == self.root:
+            culled = self.culled
+            count = self.count
+        else:
+            culled = ()
+            count = idx.leafCount[group]
+
+        # The guess was wrong, so its branch under the common group is out
+        if guess != group and idx.contains(group, guess):
+            toward = idx.childToward(group, guess)
+            if toward not in culled:
+                culled = tuple(sorted(culled + (toward,)))
+                count = count - idx.leafCount[toward]
+
+        return gameState(idx, group, culled, count)
@@ -0,0 +1,179 @@
+import json
+import re
+from bisect import bisect_left
+
+from gameState import gameState
+from treeIndex import treeIndex
+
+# Anything that isn't a letter or digit separates words, so "Gnathostomata-urchin",
+# "gnathostomata urchin" and "Gnathostomata_Urchin" are all the same
+_separators = re.compile(r"[\W_]+")
+
+
+def normalizeName(name: str) -> str:
+    """Fold a group name to the form it's looked up by
+
+    Args:
+        name (str): The name as typed or as in the tree
+
+    Returns:
+        str: The case-folded name with separators collapsed to single spaces
+    """
+    return _separators.sub(" ", name.casefold()).strip()
+
+
+def editDistance(a: str, b: str, bound: int) -> int:
+    """Get the Levenshtein distance between two strings, giving up past a bound
+
+    Args:
+        a (str): One string
+        b (str): The other string
+        bound (int): The largest distance that matters
+
+    Returns:
+        int: The distance, or bound + 1 if it's more than bound
+    """
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(
+                min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            )
+        if min(current) > bound:
+            return bound + 1
+        previous = current
+    return min(previous[-1], bound + 1)
+
+
+class groupResolver:
+    """Turn a typed common group into a node, with completion and typo suggestions
+
+    Every node's name is indexed, plus any aliases such as each species'
+    scientific name, all normalized with normalizeName. Exact lookups are a
+    single dict hit. Suggestions only consider the groups that could actually
+    be reported for the current guess, which is at most the guess's lineage.
+    """
+
+    def __init__(self, index: treeIndex, aliases: dict[str, str] = None) -> None:
+        """Build the name index for a tree
+
+        Args:
+            index (treeIndex): The tree
+            aliases (dict[str, str], optional): Extra names, mapped to the name of the node they refer to. Defaults to None.
+        """
+        self.index = index
+        self.nameToIds: dict[str, list[int]] = {}
+        for i, name in enumerate(index.names):
+            self.nameToIds.setdefault(normalizeName(name), []).append(i)
+        if aliases is not None:
+            for alias, name in aliases.items():
+                for i in index.nameToIds.get(name.lower(), ()):
+                    ids = self.nameToIds.setdefault(normalizeName(alias), [])
+                    if i not in ids:
+                        ids.append(i)
+        # Sorted keys for prefix completion
+        self.keys = sorted(self.nameToIds.keys())
+
+    @classmethod
+    def withSciNames(cls, index: treeIndex, sciNamesFile: str):
+        """Build the name index with each species' scientific name as an alias
+
+        Args:
+            index (treeIndex): The tree
+            sciNamesFile (str): sciNames.json or sciNames-flora.json
+
+        Returns:
+            groupResolver: The resolver
+        """
+        with open(sciNamesFile) as file:
+            species = json.load(file)["species"]
+        return cls(index, {s["sciName"]: s["name"] for s in species})
+
+    def validGroups(self, state: gameState, guess: int) -> list[int]:
+        """Get every group that can be reported for a guess, from the guess up
+
+        Args:
+            state (gameState): The candidates
+            guess (int): The leaf ID guessed
+
+        Returns:
+            list[int]: The guess and each of its ancestors that are in play
+        """
+        groups = []
+        node = guess
+        while -1 != node and self.index.contains(state.root, node):
+            if state.contains(node):
+                groups.append(node)
+            node = self.index.parent[node]
+        return groups
+
+    def resolve(self, text: str, state: gameState, guess: int = -1) -> int:
+        """Find the node a typed group refers to
+
+        Args:
+            text (str): The typed group
+            state (gameState): The candidates
+            guess (int, optional): The leaf ID guessed, to only accept groups valid for it. Defaults to -1.
+
+        Returns:
+            int: The node ID, or -1 if no node in play has that name
+        """
+        for i in self.nameToIds.get(normalizeName(text), ()):
+            if state.contains(i) and (-1 == guess or self.index.contains(i, guess)):
+                return i
+        return -1
+
+    def complete(self, prefix: str, limit: int = 10) -> list[str]:
+        """Get the names that start with a prefix
+
+        Args:
+            prefix (str): The start of a name
+            limit (int, optional): The most names to return. Defaults to 10.
+
+        Returns:
+            list[str]: Matching names, as written in the tree, alphabetically
+        """
+        prefix = normalizeName(prefix)
+        names = []
+        pos = bisect_left(self.keys, prefix)
+        while pos < len(self.keys) and self.keys[pos].startswith(prefix):
+            for i in self.nameToIds[self.keys[pos]]:
+                if self.index.names[i] not in names:
+                    names.append(self.index.names[i])
+            if limit <= len(names):
+                break
+            pos = pos + 1
+        return names[:limit]
+
+    def suggest(
+        self, text: str, state: gameState, guess: int, maxDistance: int = 3
+    ) -> list[str]:
+        """Suggest what a typed group that wasn't found might have meant
+
+        Args:
+            text (str): The typed group
+            state (gameState): The candidates
+            guess (int): The leaf ID guessed
+            maxDistance (int, optional): The most typos to allow. Defaults to 3.
+
+        Returns:
+            list[str]: Names of groups valid for the guess, closest first
+        """
+        typed = normalizeName(text)
+        # Short names get fewer typos, or everything would match
+        bound = min(maxDistance, max(1, len(typed) // 2))
+        scored = []
+        for node in self.validGroups(state, guess):
+            name = self.index.names[node]
+            key = normalizeName(name)
+            if typed and key.startswith(typed):
+                scored.append((0, name))
+                continue
+            distance = editDistance(typed, key, bound)
+            if distance <= bound:
+                scored.append((distance, name))
+        scored.sort(key=lambda s: s[0])
+        return [name for _, name in scored]
@@ -0,0 +1,213 @@
+import dbm
+import json
+import os
+from collections import OrderedDict
+
+from gameState import gameState
+from openingBook import treeHash
+from optimalSolver import partitionSizes
+
+# Where the file's tree hash is kept, never a fingerprint
+TREE_HASH_KEY = "treeHash"
+
+
+def guessCacheFilename(treeFile: str) -> str:
+    """Get the file a tree's guess cache is kept in, i.e. tree.json -> tree.guesses.db
+
+    Args:
+        treeFile (str): The tree file
+
+    Returns:
+        str: The cache's filename, which dbm may add extensions to
+    """
+    return os.path.splitext(treeFile)[0] + ".guesses.db"
+
+
+def fingerprint(strategyName: str, state: gameState) -> str:
+    """Name a set of candidates for the disk cache
+
+    A state is its root and culled children, and node IDs only change with the
+    tree, so this identifies the candidates for as long as the tree hash does.
+
+    Args:
+        strategyName (str): The strategy that picks the guess
+        state (gameState): The candidates
+
+    Returns:
+        str: i.e. "largest:12:14,20"
+    """
+    return (
+        strategyName
+        + ":"
+        + str(state.root)
+        + ":"
+        + ",".join(str(c) for c in state.culled)
+    )
+
+
+class guessCache:
+    """The guess each strategy picked for each set of candidates, so it's only worked out once
+
+    Games often reach the same candidates, the first guess of every game most
+    of all. The most recently used entries are kept in memory, up to a limit,
+    and every entry can also be kept in a file for later runs on the same tree.
+    Strategies always pick the same guess for the same state, so a cached
+    guess is exactly what the strategy would have returned.
+    """
+
+    def __init__(
+        self,
+        maxEntries: int = 10000,
+        filename: str = None,
+        treeDigest: str = None,
+        readOnly: bool = False,
+    ) -> None:
+        """Initialize a cache
+
+        Args:
+            maxEntries (int, optional): The most entries to keep in memory. Defaults to 10000.
+            filename (str, optional): The file to keep entries in too, none if None. Defaults to None.
+            treeDigest (str, optional): The tree's hash, the file is cleared if it was for another. Defaults to None.
+            readOnly (bool, optional): Only read the file, for worker processes sharing it. Defaults to False.
+        """
+        self.maxEntries = maxEntries
+        # (strategy, root, culled) -> (guess, expected candidates left)
+        self.entries: OrderedDict[tuple, tuple[str, float]] = OrderedDict()
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+        self.db = None
+        if filename is not None:
+            if readOnly:
+                try:
+                    self.db = dbm.open(filename, "r")
+                except dbm.error:
+                    # Nothing's been written yet
+                    pass
+                if (
+                    self.db is not None
+                    and self.db.get(TREE_HASH_KEY, b"").decode() != treeDigest
+                ):
+                    self.db.close()
+                    self.db = None
+            else:
+                self.db = dbm.open(filename, "c")
+                if self.db.get(TREE_HASH_KEY, b"").decode() != treeDigest:
+                    # Built from another tree, where the node IDs mean something else
+                    self.db.close()
+                    self.db = dbm.open(filename, "n")
+                    self.db[TREE_HASH_KEY] = treeDigest
+        self.readOnly = readOnly
+
+    def get(self, strategyName: str, state: gameState) -> tuple[str, float]:
+        """Look up the guess a strategy picked for a state
+
+        Args:
+            strategyName (str): The strategy
+            state (gameState): The candidates
+
+        Returns:
+            tuple[str, float]: The guess and the candidates it's expected to leave, or None if not cached
+        """
+        key = (strategyName, state.root, state.culled)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits = self.hits + 1
+            return entry
+
+        if self.db is not None:
+            value = self.db.get(fingerprint(strategyName, state))
+            if value is not None:
+                entry = tuple(json.loads(value))
+                self.remember(key, entry)
+                self.diskHits = self.diskHits + 1
+                return entry
+
+        self.misses = self.misses + 1
+        return None
+
+    def remember(self, key: tuple, entry: tuple[str, float]):
+        # Keep it in memory, forgetting the least recently used entry if full
+        self.entries[key] = entry
+        if self.maxEntries < len(self.entries):
+            self.entries.popitem(last=False)
+
+    def put(self, strategyName: str, state: gameState, guess: str) -> tuple[str, float]:
+        """Cache the guess a strategy picked for a state
+
+        Args:
+            strategyName (str): The strategy
+            state (gameState): The candidates
+            guess (str): The species it picked
+
+        Returns:
+            tuple[str, float]: The guess and the candidates it's expected to leave
+        """
+        sizes = partitionSizes(state, state.index.find(guess, exact=True))
+        entry = (guess, sum(s * s for s in sizes) / state.count)
+        self.remember((strategyName, state.root, state.culled), entry)
+        if self.db is not None and not self.readOnly:
+            self.db[fingerprint(strategyName, state)] = json.dumps(entry)
+        return entry
+
+    def wrap(self, strategyName: str, strategy):
+        """Make a strategy that answers from the cache, calling the real one on a miss
+
+        Args:
+            strategyName (str): The strategy's name, part of every key
+            strategy (_type_): The strategy, a function from gameState to a species name
+
+        Returns:
+            _type_: The cached strategy
+        """
+
+        def cachedStrategy(state: gameState) -> str:
+            entry = self.get(strategyName, state)
+            if entry is None:
+                entry = self.put(strategyName, state, strategy(state))
+            return entry[0]
+
+        cachedStrategy.__name__ = strategy.__name__
+        return cachedStrategy
+
+    def stats(self) -> dict:
+        """Get how well the cache is doing
+
+        Returns:
+            dict: Memory and disk hits, misses, the hit rate, and the entries in memory
+        """
+        lookups = self.hits + self.diskHits + self.misses
+        return {
+            "hits": self.hits,
+            "diskHits": self.diskHits,
+            "misses": self.misses,
+            "hitRate": (self.hits + self.diskHits) / lookups if lookups else 0,
+            "entries": len(self.entries),
+        }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def openGuessCache(
+    treeFile: str = None, maxEntries: int = 10000, readOnly: bool = False
+) -> guessCache:
+    """Open the cache for a tree, in memory only if no tree file is given
+
+    Args:
+        treeFile (str, optional): The tree file to keep the cache on disk next to. Defaults to None.
+        maxEntries (int, optional): The most entries to keep in memory. Defaults to 10000.
+        readOnly (bool, optional): Only read the file. Defaults to False.
+
+    Returns:
+        guessCache: The cache
+    """
+    if treeFile is None:
+        return guessCache(maxEntries)
+    return guessCache(
+        maxEntries, guessCacheFilename(treeFile), treeHash(treeFile), readOnly
+    )
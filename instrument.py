@@ -0,0 +1,288 @@
+import atexit
+import cProfile
+import functools
+import os
+import sys
+import time
+
+from gameState import gameState
+from treeIndex import treeIndex
+
+# Set to anything to instrument the solver from the start, see enable()
+ENV_VAR = "SOLVER_PROFILE"
+
+# The solver's module level functions that are timed
+solverFunctions = [
+    "countChildren",
+    "getAllSpecies",
+    "locate",
+    "newRoot",
+    "findSpecies",
+    "cullGroup",
+    "findCommonGroup",
+    "newGame",
+    "solveForSpecies",
+    "rankGuesses",
+]
+
+# Methods of the shared tree and the game state that are timed
+classMethods = [
+    (treeIndex, ["find", "lca", "childToward"]),
+    (gameState, ["applyClue", "countOf", "contains", "intervals", "species"]),
+]
+
+
+class callStats:
+    __slots__ = ("calls", "seconds", "active")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        # Recursive calls only count towards seconds once, from the outermost
+        self.active = 0
+
+
+class instrumentation:
+    """Counters and timers for the solver's hot paths
+
+    Nothing here runs unless enable() is called, which replaces the functions
+    being measured with wrappers. Until then the solver runs untouched.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.functions: dict[str, callStats] = {}
+        # Nodes stepped through by the tree so far, see enable()
+        self.nodes = 0
+        # (strategy, seconds, nodes visited) for each decision
+        self.turns: list[tuple[str, float, int]] = []
+
+    def stats(self, name: str) -> callStats:
+        if name not in self.functions:
+            self.functions[name] = callStats()
+        return self.functions[name]
+
+    def timed(self, name: str, func):
+        """Wrap a function to count its calls and time
+
+        Args:
+            name (str): The name to report it under
+            func (_type_): The function
+
+        Returns:
+            _type_: The wrapper
+        """
+        stats = self.stats(name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stats.calls = stats.calls + 1
+            stats.active = stats.active + 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.active = stats.active - 1
+                if 0 == stats.active:
+                    stats.seconds = stats.seconds + time.perf_counter() - start
+
+        return wrapper
+
+    def turn(self, name: str, func):
+        """Wrap a strategy to record each decision's latency and nodes visited
+
+        Args:
+            name (str): The strategy's name
+            func (_type_): The strategy
+
+        Returns:
+            _type_: The wrapper
+        """
+        timedFunc = self.timed(name, func)
+
+        @functools.wraps(func)
+        def wrapper(state):
+            startNodes = self.nodes
+            start = time.perf_counter()
+            guess = timedFunc(state)
+            self.turns.append(
+                (name, time.perf_counter() - start, self.nodes - startNodes)
+            )
+            return guess
+
+        return wrapper
+
+    def enable(self, solverModule):
+        """Start measuring, by wrapping the solver's functions and the tree's methods
+
+        Args:
+            solverModule (_type_): The solver module, which may be __main__
+        """
+        if self.enabled:
+            return
+        self.enabled = True
+
+        for name in solverFunctions:
+            setattr(solverModule, name, self.timed(name, getattr(solverModule, name)))
+        for cls, names in classMethods:
+            for name in names:
+                setattr(
+                    cls, name, self.timed(cls.__name__ + "." + name, getattr(cls, name))
+                )
+
+        # Strategies are called through the table, so wrap them there
+        for key, strategy in list(solverModule.strategies.items()):
+            wrapped = self.turn(strategy.__name__, strategy)
+            solverModule.strategies[key] = wrapped
+            setattr(solverModule, strategy.__name__, wrapped)
+
+        # Every node the tree steps through going down or up is counted
+        children = treeIndex.children
+        path = treeIndex.path
+
+        def countedChildren(index, node):
+            for child in children(index, node):
+                self.nodes = self.nodes + 1
+                yield child
+
+        def countedPath(index, ancestor, node):
+            ids = path(index, ancestor, node)
+            self.nodes = self.nodes + len(ids)
+            return ids
+
+        treeIndex.children = functools.wraps(children)(countedChildren)
+        treeIndex.path = self.timed(
+            "treeIndex.path", functools.wraps(path)(countedPath)
+        )
+
+        atexit.register(self.report)
+
+    def report(self, file=None):
+        """Print the call counts and times, and the decision latencies
+
+        Args:
+            file (_type_, optional): Where to print, stderr if None. Defaults to None.
+        """
+        if file is None:
+            file = sys.stderr
+        print("function, calls, total s, us/call", file=file)
+        for name, stats in sorted(self.functions.items(), key=lambda f: -f[1].seconds):
+            if 0 < stats.calls:
+                print(
+                    "{0}, {1}, {2:0.4f}, {3:0.2f}".format(
+                        name,
+                        stats.calls,
+                        stats.seconds,
+                        1000000 * stats.seconds / stats.calls,
+                    ),
+                    file=file,
+                )
+
+        byStrategy: dict[str, list[tuple[float, int]]] = {}
+        for name, seconds, nodes in self.turns:
+            byStrategy.setdefault(name, []).append((seconds, nodes))
+        for name, turns in byStrategy.items():
+            latencies = sorted(t for t, _ in turns)
+            nodes = [n for _, n in turns]
+            print(
+                "{0}: {1} decisions, latency us p50 {2:0.1f}, p95 {3:0.1f}, max {4:0.1f}, "
+                "nodes visited mean {5:0.1f}, max {6}".format(
+                    name,
+                    len(turns),
+                    1000000 * latencies[len(latencies) // 2],
+                    1000000
+                    * latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)],
+                    1000000 * latencies[-1],
+                    sum(nodes) / len(nodes),
+                    max(nodes),
+                ),
+                file=file,
+            )
+
+
+# The one set of counters, shared by everything
+counters = instrumentation()
+
+
+def enabledByEnv() -> bool:
+    return bool(os.environ.get(ENV_VAR))
+
+
+class stackProfiler:
+    """Sample-free profiler that writes collapsed stacks for flame graphs
+
+    Every Python call and return is seen with sys.setprofile, and the time
+    spent in each distinct stack, not counting calls it makes, is summed.
+    The output has one "outer;inner;innermost microseconds" line per stack,
+    as read by flamegraph.pl, speedscope and similar tools.
+    """
+
+    def __init__(self) -> None:
+        self.stack: list[str] = []
+        self.totals: dict[str, float] = {}
+        self.last = 0.0
+
+    def frameName(self, frame) -> str:
+        code = frame.f_code
+        return os.path.basename(code.co_filename) + ":" + code.co_name
+
+    def charge(self, now: float):
+        # Charge the time since the last event to the stack as it was
+        if self.stack:
+            key = ";".join(self.stack)
+            self.totals[key] = self.totals.get(key, 0.0) + now - self.last
+        self.last = now
+
+    def onEvent(self, frame, event, arg):
+        if "call" == event:
+            self.charge(time.perf_counter())
+            self.stack.append(self.frameName(frame))
+        elif "return" == event and self.stack:
+            self.charge(time.perf_counter())
+            self.stack.pop()
+
+    def start(self):
+        self.last = time.perf_counter()
+        sys.setprofile(self.onEvent)
+
+    def stop(self):
+        sys.setprofile(None)
+        self.charge(time.perf_counter())
+        self.stack.clear()
+
+    def write(self, filename: str):
+        with open(filename, "w") as file:
+            for key, seconds in sorted(self.totals.items()):
+                microseconds = int(1000000 * seconds)
+                if 0 < microseconds:
+                    file.write(key + " " + str(microseconds) + "\n")
+
+
+def profileCall(func, pstatsFile: str = None, collapsedFile: str = None):
+    """Run a function under cProfile or the collapsed stack profiler
+
+    Args:
+        func (_type_): Called with no arguments
+        pstatsFile (str, optional): Where to dump cProfile's stats for pstats. Defaults to None.
+        collapsedFile (str, optional): Where to write collapsed stacks, if not using cProfile. Defaults to None.
+
+    Returns:
+        _type_: What func returned
+    """
+    if pstatsFile is not None:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func)
+        profiler.dump_stats(pstatsFile)
+        print("Wrote " + pstatsFile, file=sys.stderr)
+    elif collapsedFile is not None:
+        stacks = stackProfiler()
+        stacks.start()
+        try:
+            result = func()
+        finally:
+            stacks.stop()
+        stacks.write(collapsedFile)
+        print("Wrote " + collapsedFile, file=sys.stderr)
+    else:
+        result = func()
+    return result
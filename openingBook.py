@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+
+from gameState import gameState
+
+
+def treeHash(filename: str) -> str:
+    """Hash a tree file, so books can tell when the tree they were built from changed
+
+    Args:
+        filename (str): The tree file
+
+    Returns:
+        str: The SHA-256 of the file's contents, in hex
+    """
+    with open(filename, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def bookFilename(treeFile: str, strategyName: str) -> str:
+    """Get the file a book is cached in, i.e. tree.json -> tree.largest.book.json
+
+    Args:
+        treeFile (str): The tree file the book is built from
+        strategyName (str): The strategy the book follows
+
+    Returns:
+        str: The book's filename
+    """
+    return os.path.splitext(treeFile)[0] + "." + strategyName + ".book.json"
+
+
+def outcomes(state: gameState, guess: int):
+    """Get every common group an incorrect guess could be answered with
+
+    Args:
+        state (gameState): The candidates
+        guess (int): The leaf ID guessed, which must be a candidate
+
+    Yields:
+        tuple[int, gameState]: Each possible common group and the state it leads to
+    """
+    idx = state.index
+    child = guess
+    while child != state.root:
+        group = idx.parent[child]
+        # Only groups with a candidate outside the guess's branch can be reported
+        if state.countOf(group) != state.countOf(child):
+            yield group, state.applyClue(guess, group)
+        child = group
+
+
+def buildBook(state: gameState, strategy) -> dict:
+    """Play out every answer with a strategy, recording each guess and what follows it
+
+    Args:
+        state (gameState): The state to start from
+        strategy (_type_): The strategy, a function from gameState to a species name
+
+    Returns:
+        dict: The guess as "g", and if it can be wrong, a dict "n" from each
+            reported common group (lowercase) to the book for that outcome
+    """
+    idx = state.index
+    guessName = strategy(state)
+    page = {"g": guessName}
+    if not state.isSolved():
+        guess = idx.find(guessName, state.root, exact=True)
+        page["n"] = {
+            idx.names[group].lower(): buildBook(nextState, strategy)
+            for group, nextState in outcomes(state, guess)
+        }
+    return page
+
+
+def loadBook(treeFile: str, state: gameState, strategyName: str, strategy) -> dict:
+    """Load the cached book for a tree and strategy, building it if it's missing or stale
+
+    Args:
+        treeFile (str): The tree file the state was loaded from
+        state (gameState): The starting state for that tree
+        strategyName (str): The strategy's name, for the cache file
+        strategy (_type_): The strategy, a function from gameState to a species name
+
+    Returns:
+        dict: The book, as returned by buildBook
+    """
+    filename = bookFilename(treeFile, strategyName)
+    currentHash = treeHash(treeFile)
+    try:
+        with open(filename) as file:
+            cached = json.load(file)
+        book = cached["book"]
+        # A damaged or foreign file is rebuilt like a stale one
+        if cached["treeHash"] == currentHash and isinstance(book.get("g"), str):
+            return book
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        pass
+
+    book = buildBook(state, strategy)
+    # Moved into place once written, so an interrupted write can't leave half a book
+    tmpFile = filename + ".tmp"
+    with open(tmpFile, "w") as file:
+        json.dump(
+            {"treeHash": currentHash, "strategy": strategyName, "book": book},
+            file,
+            separators=(",", ":"),
+        )
+    os.replace(tmpFile, filename)
+    return book
@@ -0,0 +1,178 @@
+from gameState import gameState
+from openingBook import outcomes
+
+
+def partitionSizes(state: gameState, guess: int) -> list[int]:
+    """Get how many candidates each wrong-guess outcome leaves
+
+    Args:
+        state (gameState): The candidates
+        guess (int): The leaf ID guessed, a candidate or not
+
+    Returns:
+        list[int]: The candidates left for each common group that could be reported
+    """
+    # A probe, a guess that can't be the answer, has the same common group with
+    # every candidate: the root, if it's in a culled branch, or above the root.
+    # So it leaves every candidate in play
+    if not state.contains(guess):
+        return [state.count]
+
+    idx = state.index
+    sizes = []
+    child = guess
+    childCount = 1
+    while child != state.root:
+        group = idx.parent[child]
+        groupCount = state.countOf(group)
+        if groupCount != childCount:
+            sizes.append(groupCount - childCount)
+        child = group
+        childCount = groupCount
+    return sizes
+
+
+class optimalSolver:
+    """Search for the guesses that minimize the expected, or worst case, number of guesses
+
+    Costs are kept as integer totals: the sum over every candidate answer of the
+    guesses needed to find it. For a guess, that's one guess per candidate plus
+    the totals of each outcome, so there's no floating point error and the
+    average is the total over the candidate count.
+
+    Every state seen is kept in a transposition table. Guesses are tried in
+    order of a lower bound, a state of n candidates needs at least 2n - 1 in
+    total since only one answer can be found on the first guess, and are cut
+    off as soon as the bound or the partial total can't beat the best so far.
+    """
+
+    def __init__(self, worstCase: bool = False) -> None:
+        """Initialize a solver with an empty transposition table
+
+        Args:
+            worstCase (bool, optional): Minimize the most guesses any answer needs instead of the average. Defaults to False.
+        """
+        self.worstCase = worstCase
+        # State -> (cost, best guess) for states solved exactly
+        self.solved: dict[gameState, tuple[int, int]] = {}
+        # State -> a proven lower bound for states that were cut off
+        self.bounds: dict[gameState, int] = {}
+
+    def lowerBound(self, count: int) -> int:
+        """Get a lower bound on the cost of any state with this many candidates
+
+        Args:
+            count (int): The number of candidates
+
+        Returns:
+            int: The lower bound
+        """
+        if self.worstCase:
+            return 1 if count <= 1 else 2
+        return 2 * count - 1
+
+    def guessBound(self, count: int, sizes: list[int]) -> int:
+        """Get a lower bound on the cost of a guess from its outcome sizes
+
+        Args:
+            count (int): The number of candidates
+            sizes (list[int]): The size of each outcome
+
+        Returns:
+            int: The lower bound
+        """
+        if self.worstCase:
+            return 1 + max((self.lowerBound(s) for s in sizes), default=0)
+        return count + sum(self.lowerBound(s) for s in sizes)
+
+    def cost(self, state: gameState, limit: int = None) -> int:
+        """Find the optimal cost of a state
+
+        Args:
+            state (gameState): The candidates
+            limit (int, optional): Stop early once the cost is known to be at least this. Defaults to None.
+
+        Returns:
+            int: The exact cost if it's under limit, otherwise a lower bound that's at least limit
+        """
+        if state.count <= 1:
+            return state.count
+        if state in self.solved:
+            return self.solved[state][0]
+        floor = self.bounds.get(state, self.lowerBound(state.count))
+        if limit is not None and limit <= floor:
+            return floor
+
+        # Try the most promising guesses first, so the best so far is tight early
+        guesses = []
+        for guess in state.species():
+            sizes = partitionSizes(state, guess)
+            guesses.append((self.guessBound(state.count, sizes), guess))
+        guesses.sort()
+
+        best = limit
+        bestGuess = -1
+        for bound, guess in guesses:
+            if best is not None and best <= bound:
+                # Sorted by bound, nothing after this can do better either
+                break
+            total = self.guessCost(state, guess, bound, best)
+            if best is None or total < best:
+                best = total
+                bestGuess = guess
+                if best == floor:
+                    # Can't do better than the lower bound
+                    break
+
+        if -1 == bestGuess:
+            # Everything was cut off, best is limit which is a valid lower bound
+            self.bounds[state] = max(floor, best)
+            return best
+
+        self.solved[state] = (best, bestGuess)
+        return best
+
+    def guessCost(self, state: gameState, guess: int, bound: int, limit: int) -> int:
+        """Find the cost of a guess, given optimal play after it
+
+        Args:
+            state (gameState): The candidates
+            guess (int): The leaf ID guessed
+            bound (int): The guess's lower bound from guessBound
+            limit (int): Stop early once the cost is known to be at least this, may be None
+
+        Returns:
+            int: The exact cost if it's under limit, otherwise a value that's at least limit
+        """
+        if self.worstCase:
+            worst = 1
+            for _, nextState in outcomes(state, guess):
+                subLimit = None if limit is None else limit - 1
+                worst = max(worst, 1 + self.cost(nextState, subLimit))
+                if limit is not None and limit <= worst:
+                    return worst
+            return worst
+
+        # Start from the bound and swap each outcome's bound for its real cost
+        total = bound
+        for _, nextState in outcomes(state, guess):
+            floor = self.lowerBound(nextState.count)
+            subLimit = None if limit is None else limit - total + floor
+            total = total - floor + self.cost(nextState, subLimit)
+            if limit is not None and limit <= total:
+                return total
+        return total
+
+    def bestGuess(self, state: gameState) -> int:
+        """Find an optimal guess
+
+        Args:
+            state (gameState): The candidates
+
+        Returns:
+            int: The leaf ID to guess
+        """
+        if state.count <= 1:
+            return state.species()[0]
+        self.cost(state)
+        return self.solved[state][1]
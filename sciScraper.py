@@ -1,13 +1,19 @@
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+import argparse
 import json
-import time
+import os
+import queue
+import random
 import sys
+import threading
+import time
 
 
 def recursiveCheckChildren(children: list, commonName: str) -> str:
@@ -22,73 +28,303 @@ def recursiveCheckChildren(children: list, commonName: str) -> str:
     return None
 
 
-def findScientificName(guessName: str, checkMetazooa: bool) -> str:
-    # driver = webdriver.Firefox()
-    # driver.get("https://metazooa.com/game?EnterGame=")
-    # # guessInput: WebElement = driver.find_element('name', 'guess')
-    # guessInput: WebElement = driver.find_element(By.ID, 'headlessui-combobox-input-P0-0')
-    # guessInput.send_keys(guessName)
-    # guessInput.send_keys(Keys.RETURN)
+class rateLimiter:
+    """Space out requests from every browser so the site isn't hammered"""
 
-    driver = webdriver.Firefox()
-    if checkMetazooa:
-        driver.get("https://metazooa.com/")
-    else:
-        driver.get("https://flora.metazooa.com/")
+    def __init__(self, perSecond: float) -> None:
+        self.interval = 1 / perSecond if 0 < perSecond else 0
+        self.lock = threading.Lock()
+        self.nextTime = time.monotonic()
 
-    try:
-        enterButton: WebElement = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.NAME, "EnterGame"))
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.nextTime - now
+            self.nextTime = max(now, self.nextTime) + self.interval
+        if 0 < delay:
+            time.sleep(delay)
+
+
+class browserSession:
+    def __init__(
+        self, baseUrl: str, headless: bool = False, timeout: float = 30
+    ) -> None:
+        """Start a browser, reused for every species it looks up
+
+        Args:
+            baseUrl (str): The game's front page
+            headless (bool, optional): Run Firefox without a window. Defaults to False.
+            timeout (float, optional): The most seconds to wait for the page. Defaults to 30.
+        """
+        self.baseUrl = baseUrl
+        self.timeout = timeout
+        options = webdriver.FirefoxOptions()
+        if headless:
+            options.add_argument("-headless")
+        self.driver = webdriver.Firefox(options=options)
+
+    def close(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            # A driver that's already dead fails to quit with connection errors
+            pass
+
+    def findScientificName(self, guessName: str) -> str:
+        """Guess a species in a fresh game and read its scientific name from the game state
+
+        Args:
+            guessName (str): The species' common name
+
+        Raises:
+            TimeoutException: If the page doesn't load, or the guess doesn't show up in the game state, in time
+
+        Returns:
+            str: The scientific name
+        """
+        driver = self.driver
+        # Start from a clean slate, the site remembers games in progress
+        driver.delete_all_cookies()
+        driver.get(self.baseUrl)
+        driver.execute_script("window.localStorage.clear();")
+        driver.get(self.baseUrl)
+
+        enterButton: WebElement = WebDriverWait(driver, self.timeout).until(
+            EC.element_to_be_clickable((By.NAME, "EnterGame"))
         )
         enterButton.click()
-        guessInput = WebDriverWait(driver, 30).until(
+        guessInput = WebDriverWait(driver, self.timeout).until(
             EC.presence_of_element_located((By.ID, "headlessui-combobox-input-P0-0"))
-        )  # This is a dummy element
+        )
         guessInput.send_keys(guessName)
         guessInput.send_keys(Keys.RETURN)
-        time.sleep(5)
-        gameJson: WebElement = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.ID, "__FRSH_STATE"))
-        )  # This is a dummy element
-        jsonStr = gameJson.get_attribute("innerHTML")
-        mzJson = json.loads(jsonStr)
-        mzTree = mzJson["v"][0][1]["data"]["children"]
-        return recursiveCheckChildren(mzTree, guessName.casefold())
+
+        # Poll the game state until the guess shows up in it, instead of a fixed sleep
+        commonName = guessName.casefold()
+
+        def guessedSciName(driver) -> str:
+            try:
+                gameJson = driver.find_element(By.ID, "__FRSH_STATE")
+                mzJson = json.loads(gameJson.get_attribute("innerHTML"))
+                mzTree = mzJson["v"][0][1]["data"]["children"]
+            except (WebDriverException, ValueError, LookupError, TypeError):
+                # Not there, or still being written
+                return None
+            return recursiveCheckChildren(mzTree, commonName)
+
+        return WebDriverWait(driver, self.timeout, poll_frequency=0.2).until(
+            guessedSciName
+        )
+
+
+class scrapeJournal:
+    """An append-only log of resolved species, so an interrupted run can pick up where it left off
+
+    Each line is one {"name", "sciName"} object, flushed to disk as soon as
+    it's found. A line cut off by a crash is ignored when the journal is read.
+    """
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.resolved: dict[str, str] = {}
+        endsCleanly = True
+        if os.path.exists(filename):
+            with open(filename) as file:
+                for line in file:
+                    endsCleanly = line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                        self.resolved[entry["name"]] = entry["sciName"]
+                    except (ValueError, KeyError, TypeError):
+                        pass
+        self.file = open(filename, "a")
+        if not endsCleanly:
+            # Start after the cut off line, not on the end of it
+            self.file.write("\n")
+
+    def record(self, name: str, sciName: str):
+        with self.lock:
+            self.resolved[name] = sciName
+            self.file.write(json.dumps({"name": name, "sciName": sciName}) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+def scrapeWorker(
+    work: queue.Queue,
+    journal: scrapeJournal,
+    failed: dict,
+    limiter: rateLimiter,
+    args,
+):
+    """Look up species from the queue with one browser until the queue is empty
+
+    Args:
+        work (queue.Queue): Species names left to look up
+        journal (scrapeJournal): Where results go
+        failed (dict): Species that ran out of retries, to the last error
+        limiter (rateLimiter): Shared by every worker
+        args (_type_): The command line arguments
+    """
+    session = None
+    try:
+        while True:
+            try:
+                species = work.get_nowait()
+            except queue.Empty:
+                return
+
+            found = False
+            try:
+                for attempt in range(args.retries + 1):
+                    try:
+                        if session is None:
+                            session = browserSession(
+                                args.base_url, args.headless, args.timeout
+                            )
+                        limiter.wait()
+                        journal.record(species, session.findScientificName(species))
+                        print(species + " found")
+                        found = True
+                        break
+                    except Exception as e:
+                        # Not just WebDriverException, a dead driver raises
+                        # connection errors, and any error here must be retried
+                        failed[species] = repr(e)
+                        # The browser may be wedged, start the next try with a new one
+                        if session is not None:
+                            session.close()
+                            session = None
+                        if attempt < args.retries:
+                            # Exponential backoff with jitter, so workers don't retry in lockstep
+                            time.sleep(
+                                args.backoff * (2**attempt) * (0.5 + random.random())
+                            )
+            finally:
+                # Every species taken off the queue is either found or reported
+                if found:
+                    failed.pop(species, None)
+                else:
+                    failed.setdefault(species, "stopped before it was found")
+                    print(species + " failed: " + failed[species])
     finally:
-        driver.quit()
+        if session is not None:
+            session.close()
 
 
-# Read a list of all species metazooa cares about
+def writeSciNames(filename: str, speciesList: list[str], resolved: dict[str, str]):
+    """Write the resolved species in sciNames.json's format, replacing the file in one step
 
-species_filename = "species.json"
-sciNames_filename = "sciNames.json"
-checkMetazooa = True
-if 1 < len(sys.argv):
-    if "metaflora" == sys.argv[1].lower():
+    Args:
+        filename (str): The file to write
+        speciesList (list[str]): The species, in the order to write them
+        resolved (dict[str, str]): Scientific names by species, missing species are left out
+    """
+    tmpFilename = filename + ".tmp"
+    with open(tmpFilename, "w") as file:
+        json.dump(
+            {
+                "species": [
+                    {"name": s, "sciName": resolved[s]}
+                    for s in speciesList
+                    if s in resolved
+                ]
+            },
+            file,
+            indent=2,
+        )
+    os.replace(tmpFilename, filename)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Get the scientific name of every species from the game's site"
+    )
+    parser.add_argument("args", nargs="*", help='"metaflora" to scrape Metaflora')
+    parser.add_argument(
+        "--workers", type=int, default=4, help="browsers to run at once"
+    )
+    parser.add_argument(
+        "--retries", type=int, default=5, help="retries per species before giving up"
+    )
+    parser.add_argument(
+        "--backoff",
+        type=float,
+        default=2.0,
+        help="seconds before the first retry, doubling each time",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=2.0,
+        help="most lookups per second, 0 for no limit",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30, help="seconds to wait for a page"
+    )
+    parser.add_argument(
+        "--headless", action="store_true", help="run the browsers without windows"
+    )
+    parser.add_argument(
+        "--base-url",
+        help="the game's front page, e.g. a local sciScraperStandIn.py server. Defaults to the real site",
+    )
+    args = parser.parse_args()
+
+    # Read a list of all species metazooa cares about
+    species_filename = "metazooa-species.json"
+    sciNames_filename = "sciNames.json"
+    baseUrl = "https://metazooa.com/"
+    if "metaflora" in [word.lower() for word in args.args]:
         species_filename = "species-flora.json"
         sciNames_filename = "sciNames-flora.json"
-        checkMetazooa = False
+        baseUrl = "https://flora.metazooa.com/"
+    if args.base_url is None:
+        args.base_url = baseUrl
 
-with open(species_filename) as file:
-    mzSpecies = json.load(file)
+    with open(species_filename) as file:
+        mzSpecies = json.load(file)["species"]
 
-with open(sciNames_filename, "w") as file:
-    file.write('{"species":[')
-    first = True
-    for species in mzSpecies["species"]:
-        found = False
-        while not found:
-            try:
-                sciName = findScientificName(species, checkMetazooa)
-                if first:
-                    first = False
-                    file.write("\n")
-                else:
-                    file.write(",\n")
-                file.write('{"name":"' + species + '", "sciName":"' + sciName + '"}')
-                file.flush()
-                found = True
-            except:
-                pass
-
-    file.write("]}\n")
+    # Species found by earlier runs are skipped
+    journal = scrapeJournal(os.path.splitext(sciNames_filename)[0] + ".journal.jsonl")
+    work = queue.Queue()
+    for species in mzSpecies:
+        if species not in journal.resolved:
+            work.put(species)
+    print(
+        str(len(mzSpecies) - work.qsize())
+        + " species already found, "
+        + str(work.qsize())
+        + " to go"
+    )
+
+    failed: dict[str, str] = {}
+    limiter = rateLimiter(args.rate)
+    workers = [
+        threading.Thread(
+            target=scrapeWorker, args=(work, journal, failed, limiter, args)
+        )
+        for _ in range(max(1, min(args.workers, work.qsize())))
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    journal.close()
+    # Only left over if every worker stopped early, so they're reported too
+    while not work.empty():
+        failed.setdefault(work.get_nowait(), "never tried")
+
+    writeSciNames(sciNames_filename, mzSpecies, journal.resolved)
+    print("Wrote " + sciNames_filename)
+    if failed:
+        print(
+            str(len(failed))
+            + " species failed, run again to retry them: "
+            + ", ".join(failed)
+        )
+        sys.exit(1)
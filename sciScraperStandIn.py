@@ -0,0 +1,118 @@
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Just enough of the game's page for sciScraper.py: the enter button, the guess
+# box, and the __FRSH_STATE script the game keeps its state in, which starts
+# without any guesses and is rewritten a moment after each one
+page = """<!DOCTYPE html>
+<html>
+<head><title>Metazooa stand-in</title></head>
+<body>
+<button name="EnterGame" onclick="enterGame()">Play</button>
+<script id="__FRSH_STATE" type="application/json">__INITIAL__</script>
+<script>
+function enterGame() {
+    var input = document.createElement("input");
+    input.id = "headlessui-combobox-input-P0-0";
+    input.addEventListener("keydown", function (event) {
+        if ("Enter" === event.key) {
+            fetch("/guess?name=" + encodeURIComponent(input.value))
+                .then(function (response) { return response.text(); })
+                .then(function (text) {
+                    document.getElementById("__FRSH_STATE").textContent = text;
+                });
+        }
+    });
+    document.body.appendChild(input);
+}
+</script>
+</body>
+</html>
+"""
+
+
+def gameState(guesses: list[tuple[str, str]]) -> dict:
+    """Make a __FRSH_STATE payload with the guessed species in its tree
+
+    Args:
+        guesses (list[tuple[str, str]]): The common and scientific name of each guess
+
+    Returns:
+        dict: The payload, shaped like the real game's
+    """
+    children = [
+        {"name": "Eukaryota", "children": [{"name": name, "scientificName": sciName}]}
+        for name, sciName in guesses
+    ]
+    return {"v": [[None, {"data": {"name": "root", "children": children}}]]}
+
+
+class standInHandler(BaseHTTPRequestHandler):
+    # Set by main
+    sciNames: dict[str, str] = {}
+    delay = 0.0
+    failRate = 0.0
+
+    def send(self, status: int, contentType: str, body: str):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if random.random() < self.failRate:
+            self.send(503, "text/plain", "try again later")
+        elif "/" == url.path:
+            self.send(
+                200, "text/html", page.replace("__INITIAL__", json.dumps(gameState([])))
+            )
+        elif "/guess" == url.path:
+            name = parse_qs(url.query).get("name", [""])[0]
+            # Answers take a varying time, like the real site
+            time.sleep(random.uniform(0, self.delay))
+            guesses = []
+            if name.casefold() in self.sciNames:
+                guesses.append((name, self.sciNames[name.casefold()]))
+            self.send(200, "application/json", json.dumps(gameState(guesses)))
+        else:
+            self.send(404, "text/plain", "not found")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve a stand-in for the game's page, to test sciScraper.py without the real site"
+    )
+    parser.add_argument("--port", type=int, default=8000, help="the port to listen on")
+    parser.add_argument(
+        "--sci-names",
+        default="sciNames.json",
+        help="the scientific names to answer with",
+    )
+    parser.add_argument(
+        "--delay", type=float, default=2.0, help="most seconds to take per guess"
+    )
+    parser.add_argument(
+        "--fail-rate",
+        type=float,
+        default=0.0,
+        help="fraction of requests to fail, to test retries",
+    )
+    args = parser.parse_args()
+
+    with open(args.sci_names) as file:
+        standInHandler.sciNames = {
+            s["name"].casefold(): s["sciName"] for s in json.load(file)["species"]
+        }
+    standInHandler.delay = args.delay
+    standInHandler.failRate = args.fail_rate
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), standInHandler)
+    print("Serving on http://127.0.0.1:" + str(args.port) + "/")
+    server.serve_forever()
@@ -1,6 +1,42 @@
+import argparse
+import hashlib
+import heapq
 import json
-import copy
+import math
+import multiprocessing
+import os
 import sys
+import time
+
+import instrument
+
+from gameState import gameState
+from groupNames import groupResolver
+from guessCache import guessCache, openGuessCache
+from openingBook import bookFilename, loadBook
+from optimalSolver import optimalSolver, partitionSizes
+from treeIndex import treeIndex
+
+try:
+    from exhaustiveEngine import exhaustiveEngine
+except ImportError:
+    # NumPy isn't installed, findBestGuessExhaustive falls back to pure Python
+    exhaustiveEngine = None
+
+try:
+    import readline
+except ImportError:
+    # Not on Windows, where names just aren't completed
+    readline = None
+
+# Shared by every call to findBestGuessOptimal so solved states are reused
+_optimal = optimalSolver()
+
+# The compiled index of the most recently used tree, see locate().
+# The dicts are kept alive so their id()s stay valid keys
+_index: treeIndex = None
+_indexDicts: list = []
+_indexIds: dict[int, int] = {}
 
 
 def countChildren(node) -> int:
@@ -12,126 +48,278 @@ def countChildren(node) -> int:
     Returns:
         int: the number of children of this node
     """
-    if "children" in node.keys():
-        count = 0
-        for child in node["children"]:
-            count = count + countChildren(child)
-    else:
-        count = 1
-
-    node["count"] = count
-    return count
+    if "children" not in node:
+        node["count"] = 1
+        return 1
+
+    # One pass with an explicit stack. A node's count is kept in a local while
+    # its children are visited, and added to its parent's when it's done
+    parent = node
+    siblings = iter(node["children"])
+    count = 0
+    stack = []
+    while True:
+        for child in siblings:
+            if "children" in child:
+                stack.append((parent, siblings, count))
+                parent = child
+                siblings = iter(child["children"])
+                count = 0
+                break
+            child["count"] = 1
+            count = count + 1
+        else:
+            parent["count"] = count
+            if not stack:
+                return count
+            parent, siblings, above = stack.pop()
+            count = above + count
 
 
-def findBestGuess(node) -> str:
+def findBestGuess(state: gameState) -> str:
     """Find the species down the path of most bisected nodes
 
     Args:
-        node (_type_): The node to start with
+        state (gameState): The candidates to guess from
 
     Returns:
         str: A species name to guess
     """
-    totalCount = node["count"]
-    if "children" in node.keys():
+    node = state.root
+    while not state.index.isLeaf(node):
+        totalCount = state.countOf(node)
         diffFromHalf = 0.5
         bestChild = None
-        for child in node["children"]:
-            cDiff = abs(0.5 - (child["count"] / totalCount))
+        bestCount = 0
+        for child in state.children(node):
+            childCount = state.countOf(child)
+            cDiff = abs(0.5 - (childCount / totalCount))
             if cDiff < diffFromHalf:
                 diffFromHalf = cDiff
                 bestChild = child
+                bestCount = childCount
             elif cDiff == diffFromHalf:
-                if (bestChild is None) or (bestChild["count"] < child["count"]):
+                if (bestChild is None) or (bestCount < childCount):
                     bestChild = child
-        return findBestGuess(bestChild)
-    else:
-        return node["name"]
+                    bestCount = childCount
+        node = bestChild
+    return state.index.names[node]
 
 
-def findBestGuessLargest(node) -> str:
+def findBestGuessLargest(state: gameState) -> str:
     """Find the species down the path of largest counts per-node
 
     Args:
-        node (_type_): The node to start with
+        state (gameState): The candidates to guess from
 
     Returns:
         str: A species name to guess
     """
-    if "children" in node.keys():
+    node = state.root
+    while not state.index.isLeaf(node):
         bestChild = None
         mostKids = 0
-        for child in node["children"]:
-            if "count" in child.keys():
-                thisChildsCount = child["count"]
-            else:
-                thisChildsCount = 0
-
+        for child in state.children(node):
+            thisChildsCount = state.countOf(child)
             if mostKids < thisChildsCount:
                 mostKids = thisChildsCount
                 bestChild = child
-        return findBestGuessLargest(bestChild)
-    else:
-        return node["name"]
+        node = bestChild
+    return state.index.names[node]
+
+
+def findBestGuessEntropy(state: gameState) -> str:
+    """Find the species whose common group tells the most about the answer
+
+    Each guess splits the candidates into outcomes: the guess itself, and for
+    every ancestor, the candidates under it but not under the child leading to
+    the guess. The guess with the most expected information, the entropy of
+    those outcome sizes, is picked. All of them are scored in one walk, see
+    iterGuessKeys.
+
+    Args:
+        state (gameState): The candidates to guess from
+
+    Returns:
+        str: A species name to guess
+    """
+    # Keys are the negated entropy, then preorder, so the first best wins
+    _, bestGuess = min(iterGuessKeys(state, "information"), key=lambda item: item[0])
+    return state.index.names[bestGuess]
 
 
 def getAllSpecies(node):
-    speciesList = []
-    if "children" in node.keys():
-        for child in node["children"]:
-            speciesList.extend(getAllSpecies(child))
-    else:
-        speciesList.append(node["name"])
-    return speciesList
+    """Get the name of every species under a node, in tree order
 
+    Args:
+        node (_type_): The node to start with
 
-def findBestGuessExhaustive(originalNode) -> str:
-    # Get a list of all potential guesses
-    allSpecies = getAllSpecies(originalNode)
+    Yields:
+        str: Each species name
+    """
+    if "children" not in node:
+        yield node["name"]
+        return
+
+    # The stack holds an iterator over the siblings left at each level
+    stack = [iter(node["children"])]
+    while stack:
+        for child in stack[-1]:
+            if "children" in child:
+                stack.append(iter(child["children"]))
+                break
+            yield child["name"]
+        else:
+            stack.pop()
+
+
+def findBestGuessExhaustive(state: gameState) -> str:
+    """Find the species which leaves the fewest candidates on average
+
+    Args:
+        state (gameState): The candidates to guess from
+
+    Returns:
+        str: A species name to guess
+    """
+    idx = state.index
+    if exhaustiveEngine is not None:
+        return idx.names[exhaustiveEngine.forIndex(idx).bestGuess(state)]
 
-    # Shortcut to always start with mink
-    if 255 == len(allSpecies):
-        return "mink"
+    # Get a list of all potential guesses
+    allSpecies = state.species()
 
     fewestRemaining = 10000000
 
-    speciesChecked = 0
     for possibleGuess in allSpecies:
-        # print(
-        #     "{0:0.2f}".format(100 * speciesChecked / len(allSpecies))
-        #     + " - checking "
-        #     + possibleGuess
-        # )
-        speciesChecked = speciesChecked + 1
         numRemaining = 0
         for possibleResult in allSpecies:
-            tree = copy.deepcopy(originalNode)
+            # The common group between the guess and the species narrows the game
+            commonGroup = idx.lca(possibleGuess, possibleResult)
+            numRemaining = (
+                numRemaining + state.applyClue(possibleGuess, commonGroup).count
+            )
+
+        if (numRemaining / len(allSpecies)) < fewestRemaining:
+            fewestRemaining = numRemaining / len(allSpecies)
+            bestGuess = possibleGuess
 
-            # Find the common group between the guess and the species
-            commonGroup = findCommonGroup(tree, possibleGuess, possibleResult)
+    return idx.names[bestGuess]
 
-            # Set the new root to the common group
-            tree = newRoot(tree, commonGroup.lower())
 
-            if "children" in tree.keys():
-                # Cull the branch under the common group leading to the guess, since that was incorrect
-                groupList = findSpecies(tree, possibleGuess)
-                for idx in range(len(groupList)):
-                    if groupList[idx].lower() == commonGroup.lower():
-                        cullGroup(tree, groupList[idx + 1].lower())
-                        break
+def findBestGuessProbe(state: gameState) -> str:
+    """Find the species, candidate or not, which leaves the fewest candidates on average
 
-            countChildren(tree)
-            numRemaining = numRemaining + tree["count"]
+    Like findBestGuessExhaustive, but every species in the tree is scored, not
+    just the candidates. Each one's outcome sizes come from the shared index in
+    O(depth), so this costs about the same as scoring the candidates alone.
 
-        if (numRemaining / len(allSpecies)) < fewestRemaining:
-            fewestRemaining = numRemaining / len(allSpecies)
-            bestGuess = possibleGuess
+    Args:
+        state (gameState): The candidates to guess from
+
+    Returns:
+        str: A species name to guess
+    """
+    idx = state.index
+    candidates = state.species()
+    inPlay = set(candidates)
+    bestGuess = None
+    fewestRemaining = None
+    # Candidates first, so they win ties, since they might be the answer
+    for guess in candidates + [leaf for leaf in idx.leaves if leaf not in inPlay]:
+        # Each outcome's candidates stay in play for every answer in it
+        remaining = sum(size * size for size in partitionSizes(state, guess))
+        if guess in inPlay:
+            # Guessing the answer leaves just it
+            remaining = remaining + 1
+        if fewestRemaining is None or remaining < fewestRemaining:
+            fewestRemaining = remaining
+            bestGuess = guess
+    return idx.names[bestGuess]
+
+
+def findBestGuessOptimal(state: gameState) -> str:
+    """Find the species that minimizes the expected number of guesses, with optimal play after it
+
+    Args:
+        state (gameState): The candidates to guess from
+
+    Returns:
+        str: A species name to guess
+    """
+    return state.index.names[_optimal.bestGuess(state)]
 
-        # print(possibleGuess + " -> " + str(numRemaining / len(allSpecies)))
 
-    # print("BEST GUESS IS " + bestGuess + " WITH " + str(fewestRemaining) + " LEFT")
-    return bestGuess
+def locate(node) -> tuple[treeIndex, int]:
+    """Get the compiled index for the tree a node belongs to, compiling it if needed
+
+    Args:
+        node (_type_): Any node of a tree loaded from tree.json
+
+    Returns:
+        tuple[treeIndex, int]: The compiled index and the node's ID in it
+    """
+    global _index, _indexDicts, _indexIds
+    nodeId = _indexIds.get(id(node))
+    if nodeId is None:
+        # A tree that hasn't been seen, compile it from this node down
+        _indexDicts = []
+        _index = treeIndex.fromJson(node, _indexDicts)
+        _indexIds = {id(d): i for i, d in enumerate(_indexDicts)}
+        nodeId = 0
+    return _index, nodeId
+
+
+def getIndex(node) -> treeIndex:
+    """Get the compiled index for the tree a node belongs to, compiling it if needed
+
+    Args:
+        node (_type_): Any node of a tree loaded from tree.json
+
+    Returns:
+        treeIndex: The compiled index containing this node
+    """
+    return locate(node)[0]
+
+
+def resolvePath(node, path: list[int]) -> list:
+    """Follow a path of index IDs through a tree's dicts
+
+    Args:
+        node (_type_): The node to start with, matching the first ID in path
+        path (list[int]): The index IDs from node down to the target
+
+    Returns:
+        list: The node for each ID in path, or None if the path was culled
+    """
+    idx = getIndex(node)
+    nodes = [node]
+    for nodeId in path[1:]:
+        taxId = idx.taxIds[nodeId]
+        for child in node.get("children", ()):
+            if child["id"] == taxId:
+                node = child
+                break
+        else:
+            return None
+        nodes.append(node)
+    return nodes
+
+
+def resolveNode(node, path: list[int]):
+    """Follow a path of index IDs through a tree's dicts
+
+    Args:
+        node (_type_): The node to start with, matching the first ID in path
+        path (list[int]): The index IDs from node down to the target
+
+    Returns:
+        _type_: The node at the end of the path, or None if it was culled
+    """
+    nodes = resolvePath(node, path)
+    if nodes is None:
+        return None
+    return nodes[-1]
 
 
 def newRoot(node, group):
@@ -144,17 +332,11 @@ def newRoot(node, group):
     Returns:
         _type_: The found node
     """
-    if node["name"].lower() == group:
-        return node
-    if "children" in node.keys():
-        for child in node["children"]:
-            if child["name"].lower() == group:
-                return child
-            else:
-                nr = newRoot(child, group)
-                if nr is not None:
-                    return nr
-    return None
+    idx, start = locate(node)
+    found = idx.find(group, start)
+    if -1 == found:
+        return None
+    return resolveNode(node, idx.path(start, found))
 
 
 def findSpecies(node, species):
@@ -167,33 +349,42 @@ def findSpecies(node, species):
     Returns:
         _type_: An array of node names from the root to the species
     """
-    if node["name"] == species:
-        return [node["name"]]
-    elif "children" in node.keys():
-        for child in node["children"]:
-            nameList = findSpecies(child, species)
-            if nameList is not None:
-                nameList.insert(0, node["name"])
-                return nameList
-    return None
+    idx, start = locate(node)
+    found = idx.find(species, start, exact=True)
+    if -1 == found:
+        return None
+    path = idx.path(start, found)
+    if resolveNode(node, path) is None:
+        return None
+    return [idx.names[i] for i in path]
 
 
 def cullGroup(node, group):
     """Remove a group from the tree
 
+    If the tree was counted with countChildren, the counts from node down to
+    the removed group are reduced to match, so there's no need to count again.
+
     Args:
         node (_type_): The node to start with
         group (_type_): The name of the group to remove
     """
-    # For each child
-    if "children" in node.keys():
-        for child in node["children"]:
-            # If the name matches cull it
-            if child["name"].lower() == group:
-                node["children"].remove(child)
-                return
-            else:
-                cullGroup(child, group)
+    idx, start = locate(node)
+    # The node itself is never culled, only groups beneath it
+    for found in idx.nameToIds.get(group.lower(), ()):
+        if found != start and idx.contains(start, found):
+            pathNodes = resolvePath(node, idx.path(start, idx.parent[found]))
+            if pathNodes is None:
+                continue
+            parentNode = pathNodes[-1]
+            for child in parentNode["children"]:
+                if child["id"] == idx.taxIds[found]:
+                    parentNode["children"].remove(child)
+                    # Only the counts along the path to the node change
+                    if "count" in child.keys():
+                        for pathNode in pathNodes:
+                            pathNode["count"] = pathNode["count"] - child["count"]
+                    return
 
 
 def findCommonGroup(tree, guess, species):
@@ -207,109 +398,645 @@ def findCommonGroup(tree, guess, species):
     Returns:
         _type_: The name of the common group for the two species
     """
-    guessList = findSpecies(tree, guess)
-    speciesList = findSpecies(tree, species)
-    for idx in range(min(len(guessList), len(speciesList))):
-        if guessList[idx] != speciesList[idx]:
-            return guessList[idx - 1]
-    return species
+    idx, start = locate(tree)
+    guessId = idx.find(guess, start, exact=True)
+    speciesId = idx.find(species, start, exact=True)
+    return idx.names[idx.lca(guessId, speciesId)]
+
+
+def newGame(tree) -> gameState:
+    """Start a game on a tree, with every species under the given node in play
+
+    Args:
+        tree (_type_): The node to start with, or a gameState which is returned as is
+
+    Returns:
+        gameState: The starting state
+    """
+    if isinstance(tree, gameState):
+        return tree
+    idx, start = locate(tree)
+    return gameState(idx, start)
 
 
-def solveForSpecies(tree, species):
+def solveForSpecies(tree, species, strategy=findBestGuessLargest):
     """Automatically solve for a given species
 
     Args:
-        tree (_type_): The node to start with
+        tree (_type_): The node or gameState to start with
         species (_type_): Ths species to solve for
+        strategy (_type_, optional): The strategy to pick guesses with. Defaults to findBestGuessLargest.
 
     Returns:
         _type_: The number of guesses required to find this species
     """
-    bestGuess = ""
+    state = newGame(tree)
+    idx = state.index
+    speciesId = idx.find(species, exact=True)
     guesses = 1
-    while bestGuess != species:
-        # Count children again count for next iteration
-        countChildren(tree)
-
+    while True:
         # Find the best guess in the current tree
-        bestGuess = findBestGuessLargest(tree)
-
-        # Find the common group between the guess and the species
-        commonGroup = findCommonGroup(tree, bestGuess, species)
+        bestGuess = strategy(state)
 
         # If it's a match
         if bestGuess == species:
             # We're done
             return guesses
 
-        # Set the new root to the common group
-        tree = newRoot(tree, commonGroup.lower())
-
-        # Cull the branch under the common group leading to the guess, since that was incorrect
-        groupList = findSpecies(tree, bestGuess)
-        for idx in range(len(groupList)):
-            if groupList[idx].lower() == commonGroup.lower():
-                cullGroup(tree, groupList[idx + 1].lower())
-                break
+        # Narrow to the common group between the guess and the species, less the guess's branch
+        guessId = idx.find(bestGuess, exact=True)
+        state = state.applyClue(guessId, idx.lca(guessId, speciesId))
 
         guesses = guesses + 1
 
-    return guesses
 
+def scoreGuess(state: gameState, guess: int) -> dict:
+    """Score a guess by what it leaves of the candidates
 
-################################################################################
+    Args:
+        state (gameState): The candidates
+        guess (int): The leaf ID guessed, which must be a candidate
 
-# Uncomment this to solve for all species and print data
-# with open("metazooa-species.json") as file:
-#     mzSpecies = json.load(file)
-#     totalSpecies = 0
-#     totalGuesses = 0
-#     # For each species
-#     for species in mzSpecies["species"]:
-#         # Reload the tree
-#         with open("tree.json") as file:
-#             tree = json.load(file)
-#             # Solve for the species automatically
-#             guesses = solveForSpecies(tree, species)
-#             print('"' + species + '", "' + str(guesses) + '"')
-#             totalSpecies = totalSpecies + 1
-#             totalGuesses = totalGuesses + guesses
-#             print("{0:0.2f}".format(100 * totalSpecies / len(mzSpecies["species"])))
-#     print("avg: " + str(totalGuesses / totalSpecies))
-
-filename = "tree.json"
-if 1 < len(sys.argv):
-    if "metaflora" == sys.argv[1].lower():
-        filename = "tree-flora.json"
-
-with open(filename) as file:
-    tree = json.load(file)
+    Returns:
+        dict: The guess's name, the candidates it's expected to leave, the most it
+            can leave, the bits of information it's expected to give, and the
+            number of candidates now
+    """
+    # Guessing the answer leaves just it
+    sizes = partitionSizes(state, guess) + [1]
+    return {
+        "name": state.index.names[guess],
+        "expected": sum(size * size for size in sizes) / state.count,
+        "worstCase": max(sizes),
+        "information": sum(
+            size / state.count * math.log2(state.count / size) for size in sizes
+        ),
+        "remaining": state.count,
+    }
+
+
+def iterGuessKeys(state: gameState, ranking: str):
+    """Walk the candidates once, giving each the key it's ranked by, lowest first
+
+    A guess's outcome sizes are the rest of each ancestor beside the child
+    leading to the guess, so scores that sum over outcomes sum over the path:
+    each term is added once for every guess under the child it applies to.
+    "largest" and "half" rank by the choices their strategies make going
+    down, so their best is the strategy's guess.
 
-    while True:
-        # Count children again count for next iteration
-        countChildren(tree)
+    Args:
+        state (gameState): The candidates
+        ranking (str): "largest", "half", "expected" or "information"
 
-        # Find the best guess in the current tree
-        bestGuess = findBestGuessLargest(tree)
+    Yields:
+        tuple[tuple, int]: The key and leaf ID of each candidate, in preorder
+    """
+    idx = state.index
+    total = state.count
+
+    def term(size: int) -> float:
+        p = size / total
+        return -p * math.log2(p)
+
+    order = 0
+    # Below the root nothing is culled, so counts there are the whole subtree's
+    stack = [(state.root, state.count, 0.0, ())]
+    while stack:
+        node, count, score, path = stack.pop()
+        if idx.isLeaf(node):
+            if "expected" == ranking:
+                key = (score + 1, order)
+            elif "information" == ranking:
+                key = (-(score + term(1)), order)
+            else:
+                key = path
+            order = order + 1
+            yield key, node
+            continue
+        children = list(state.children(node))
+        for position in range(len(children) - 1, -1, -1):
+            child = children[position]
+            childCount = idx.leafCount[child]
+            childScore = score
+            rest = count - childCount
+            if 0 != rest:
+                if "expected" == ranking:
+                    childScore = score + rest * rest
+                elif "information" == ranking:
+                    childScore = score + term(rest)
+            childPath = path
+            if "largest" == ranking:
+                childPath = path + ((-childCount, position),)
+            elif "half" == ranking:
+                childPath = path + (
+                    (abs(0.5 - childCount / count), -childCount, position),
+                )
+            stack.append((child, childCount, childScore, childPath))
+
+
+def rankGuesses(
+    state: gameState, strategyName: str = "largest", k: int = 5
+) -> list[dict]:
+    """Get the k best guesses for a strategy with their scores, from one walk and a bounded heap
+
+    Exhaustive, probe and optimal rank by the candidates each guess is
+    expected to leave. Probes always leave more than a candidate, so only
+    candidates are ranked.
+
+    Args:
+        state (gameState): The candidates
+        strategyName (str, optional): A key of strategies. Defaults to "largest".
+        k (int, optional): The most guesses to return. Defaults to 5.
+
+    Returns:
+        list[dict]: The best guesses first, each scored by scoreGuess
+    """
+    ranking = guessRankings.get(strategyName, "expected")
+    best = heapq.nsmallest(k, iterGuessKeys(state, ranking), key=lambda item: item[0])
+    return [scoreGuess(state, leaf) for _, leaf in best]
+
+
+# Strategies by the name used on the command line
+strategies = {
+    "largest": findBestGuessLargest,
+    "exhaustive": findBestGuessExhaustive,
+    "half": findBestGuess,
+    "optimal": findBestGuessOptimal,
+    "entropy": findBestGuessEntropy,
+    "probe": findBestGuessProbe,
+}
+
+# What each strategy's alternatives are ranked by, see iterGuessKeys
+guessRankings = {
+    "largest": "largest",
+    "half": "half",
+    "entropy": "information",
+}
+
+# Tree and species list files for each game
+gameFiles = {
+    "metazooa": ("tree.json", "metazooa-species.json"),
+    "metaflora": ("tree-flora.json", "species-flora.json"),
+}
+
+# Scientific names of each game's species, also accepted as common groups
+sciNameFiles = {
+    "metazooa": "sciNames.json",
+    "metaflora": "sciNames-flora.json",
+}
+
+
+def loadGame(filename: str) -> gameState:
+    """Load a tree file and start a game with every species in play
+
+    If treeGen wrote a binary tree next to the JSON one (tree.bin for tree.json)
+    and it was built from the JSON as it is now, that's loaded instead.
+
+    Args:
+        filename (str): The tree file to load
+
+    Returns:
+        gameState: The starting state
+    """
+    with open(filename, "rb") as file:
+        data = file.read()
+
+    binFilename = os.path.splitext(filename)[0] + ".bin"
+    if os.path.exists(binFilename):
+        idx = treeIndex.fromBinary(binFilename, hashlib.sha256(data).digest())
+        if idx is not None:
+            return gameState(idx)
+
+    return newGame(json.loads(data))
+
+
+# The starting state, strategy and guess cache used by each batch worker process
+_batchState: gameState = None
+_batchStrategy = None
+_batchCache: guessCache = None
+
+
+def _initBatchWorker(
+    state: gameState,
+    strategyName: str,
+    cacheSize: int = 0,
+    cacheFor: str = None,
+    readOnly: bool = False,
+):
+    global _batchState, _batchStrategy, _batchCache
+    _batchState = state
+    _batchStrategy = strategies[strategyName]
+    _batchCache = None
+    if 0 < cacheSize:
+        _batchCache = openGuessCache(cacheFor, cacheSize, readOnly)
+        _batchStrategy = _batchCache.wrap(strategyName, _batchStrategy)
+
+
+def _cacheCounts() -> tuple[int, int, int]:
+    if _batchCache is None:
+        return 0, 0, 0
+    return _batchCache.hits, _batchCache.diskHits, _batchCache.misses
+
+
+def _solveBatchSpecies(species: str) -> tuple[str, int, tuple[int, int, int]]:
+    # Each worker has its own cache, so report how it did on this species to be summed
+    before = _cacheCounts()
+    guesses = solveForSpecies(_batchState, species, _batchStrategy)
+    return species, guesses, tuple(a - b for a, b in zip(_cacheCounts(), before))
+
+
+def solveAll(
+    state: gameState,
+    speciesList: list[str],
+    strategyName: str = "largest",
+    jobs=None,
+    cacheSize: int = 0,
+    cacheFor: str = None,
+) -> dict:
+    """Automatically solve for every species in a list
+
+    Args:
+        state (gameState): The starting state, shared read-only by all the solves
+        speciesList (list[str]): The species to solve for
+        strategyName (str, optional): A key of strategies. Defaults to "largest".
+        jobs (_type_, optional): The number of worker processes, None for one per CPU. Defaults to None.
+        cacheSize (int, optional): Guesses each process keeps in memory, 0 for no cache. Defaults to 0.
+        cacheFor (str, optional): The tree file to also keep guesses on disk for, see guessCache. Only
+            one process adds to the file, so new guesses are only kept if jobs is 1. Defaults to None.
+
+    Returns:
+        dict: The guesses per species, the distribution of guess counts, the mean,
+            species that aren't in the tree, the wall-clock seconds taken, and the
+            cache's hits and misses if there was one
+    """
+    start = time.perf_counter()
+
+    # Species missing from the tree can't be solved, report them instead
+    idx = state.index
+    missing = [s for s in speciesList if -1 == idx.find(s, state.root, exact=True)]
+    toSolve = [s for s in speciesList if s not in missing]
+
+    if 1 == jobs:
+        _initBatchWorker(state, strategyName, cacheSize, cacheFor)
+        results = [_solveBatchSpecies(s) for s in toSolve]
+        if _batchCache is not None:
+            _batchCache.close()
+    else:
+        with multiprocessing.Pool(
+            jobs,
+            initializer=_initBatchWorker,
+            initargs=(state, strategyName, cacheSize, cacheFor, True),
+        ) as pool:
+            results = pool.map(_solveBatchSpecies, toSolve, chunksize=8)
+
+    guesses = {species: count for species, count, _ in results}
+    distribution: dict[int, int] = {}
+    for count in guesses.values():
+        distribution[count] = distribution.get(count, 0) + 1
+
+    batch = {
+        "strategy": strategyName,
+        "guesses": guesses,
+        "distribution": dict(sorted(distribution.items())),
+        "mean": sum(guesses.values()) / len(guesses) if guesses else 0,
+        "missing": missing,
+        "seconds": time.perf_counter() - start,
+    }
+    if 0 < cacheSize:
+        hits, diskHits, misses = (sum(c[i] for _, _, c in results) for i in range(3))
+        lookups = hits + diskHits + misses
+        batch["cache"] = {
+            "hits": hits,
+            "diskHits": diskHits,
+            "misses": misses,
+            "hitRate": (hits + diskHits) / lookups if lookups else 0,
+        }
+    return batch
+
+
+def printBatch(results: dict):
+    """Print the results of solveAll
+
+    Args:
+        results (dict): The results to print
+    """
+    for species, count in results["guesses"].items():
+        print('"' + species + '", "' + str(count) + '"')
+    for species in results["missing"]:
+        print(species + " is not in the tree, skipped")
+    print("distribution:")
+    for count, numSpecies in results["distribution"].items():
+        print("  " + str(count) + " guesses: " + str(numSpecies))
+    print("strategy: " + results["strategy"])
+    print("avg: " + str(results["mean"]))
+    if "cache" in results:
+        cache = results["cache"]
+        print(
+            "cache: {0} hits, {1} from disk, {2} misses, {3:0.1%} hit rate".format(
+                cache["hits"], cache["diskHits"], cache["misses"], cache["hitRate"]
+            )
+        )
+    print("time: {0:0.3f}s".format(results["seconds"]))
+
+
+def printProbes(state: gameState, speciesList: list[str], jobs=None):
+    """Print whether guessing species that can't be the answer lowers the average
+
+    Args:
+        state (gameState): The starting state
+        speciesList (list[str]): The species to solve for
+        jobs (_type_, optional): The number of worker processes, None for one per CPU. Defaults to None.
+    """
+    means = {}
+    for strategyName in ("largest", "exhaustive", "probe"):
+        means[strategyName] = solveAll(state, speciesList, strategyName, jobs)["mean"]
+        print(strategyName + " avg: " + str(means[strategyName]))
+    if means["probe"] < min(means["largest"], means["exhaustive"]):
+        print("probes lower the average")
+    else:
+        print("probes don't lower the average")
+
+
+def printOptimal(state: gameState, speciesList: list[str]):
+    """Print the provably optimal average and worst case, and how each strategy compares
+
+    Args:
+        state (gameState): The starting state
+        speciesList (list[str]): The species to run each strategy against
+    """
+    for worstCase in (False, True):
+        start = time.perf_counter()
+        solver = optimalSolver(worstCase)
+        cost = solver.cost(state)
+        if worstCase:
+            print("optimal worst case: " + str(cost), end="")
+        else:
+            print("optimal avg: " + str(cost / state.count), end="")
+        print(
+            " (first guess "
+            + state.index.names[solver.bestGuess(state)]
+            + ", {0} states, {1:0.3f}s)".format(
+                len(solver.solved) + len(solver.bounds), time.perf_counter() - start
+            )
+        )
+
+    for strategyName in strategies.keys():
+        results = solveAll(state, speciesList, strategyName, 1)
+        print(
+            strategyName
+            + " avg: "
+            + str(results["mean"])
+            + ", worst case: "
+            + str(max(results["distribution"].keys()))
+        )
+
+
+def enableCompletion(resolver: groupResolver):
+    """Complete group and species names with tab at the interactive prompts
+
+    Args:
+        resolver (groupResolver): Completes the names
+    """
+    if readline is None:
+        return
+    matches = []
+
+    def completer(text: str, i: int) -> str:
+        # Called with 0, 1, ... until it returns None, so match once per tab
+        if 0 == i:
+            matches[:] = resolver.complete(text)
+        return matches[i] if i < len(matches) else None
+
+    readline.set_completer(completer)
+    # Names have spaces, so the whole line is completed
+    readline.set_completer_delims("")
+    if "libedit" in (readline.__doc__ or ""):
+        readline.parse_and_bind("bind ^I rl_complete")
+    else:
+        readline.parse_and_bind("tab: complete")
+
+
+def interactive(
+    state: gameState,
+    strategy=findBestGuessLargest,
+    book: dict = None,
+    resolver: groupResolver = None,
+    strategyName: str = "largest",
+    top: int = 5,
+):
+    """Suggest guesses and narrow the game with the common groups the user enters
+
+    Args:
+        state (gameState): The starting state
+        strategy (_type_, optional): The strategy to pick guesses with. Defaults to findBestGuessLargest.
+        book (dict, optional): A precomputed book for this state and strategy. Defaults to None.
+        resolver (groupResolver, optional): Resolves typed common groups, tree names only if None. Defaults to None.
+        strategyName (str, optional): The strategy's name, to rank other guesses by. Defaults to "largest".
+        top (int, optional): The number of guesses to offer, 1 to just suggest one. Defaults to 5.
+    """
+    if resolver is None:
+        resolver = groupResolver(state.index)
+    enableCompletion(resolver)
+    while True:
+        # Look the best guess up in the book, or search for it if off the book
+        if book is not None:
+            bestGuess = book["g"]
+        else:
+            bestGuess = strategy(state)
+        guess = state.index.find(bestGuess, exact=True)
 
         # Prompt the user
-        print("Is it a " + bestGuess + "?")
-        commonGroup = input("Common group: ")
-
-        # Set the new root to the common group
-        nr = newRoot(tree, commonGroup.lower())
-        # If the new root isn't found, it's probably a typo
-        if nr is not None:
-            # All good
-            tree = nr
+        if 1 == top:
+            print("Is it a " + bestGuess + "?")
         else:
-            # Prompt the user to try again
-            print(commonGroup + " not found. Try again.")
-            continue
+            # The strategy's guess comes first, then the best of the rest
+            ranked = [scoreGuess(state, guess)] + [
+                r
+                for r in rankGuesses(state, strategyName, top)
+                if r["name"] != bestGuess
+            ]
+            ranked = ranked[:top]
+            print("Best guesses of " + str(state.count) + " candidates:")
+            for i, r in enumerate(ranked):
+                print(
+                    "  {0}. {1}: {2:0.1f} left on average, {3} at most, {4:0.2f} bits".format(
+                        i + 1,
+                        r["name"],
+                        r["expected"],
+                        r["worstCase"],
+                        r["information"],
+                    )
+                )
+            choice = input(
+                "Guess (enter for 1, a number, or any species in play): "
+            ).strip()
+            if choice:
+                if choice.isdigit() and 1 <= int(choice) <= len(ranked):
+                    choice = ranked[int(choice) - 1]["name"]
+                chosen = state.findSpecies(choice)
+                if -1 == chosen:
+                    print(choice + " isn't a species in play. Try again.")
+                    continue
+                if chosen != guess:
+                    # The book only covers its own guesses
+                    guess = chosen
+                    book = None
+        group = -1
+        while -1 == group:
+            commonGroup = input("Common group: ")
+
+            # Only the guess and its ancestors can be the common group
+            group = resolver.resolve(commonGroup, state, guess)
+            # If the group isn't found, it's probably a typo
+            if -1 == group:
+                # Prompt the user to try again, with the closest valid groups
+                suggestions = resolver.suggest(commonGroup, state, guess)
+                if suggestions:
+                    print(
+                        commonGroup
+                        + " not found. Did you mean "
+                        + " or ".join(suggestions[:3])
+                        + "?"
+                    )
+                else:
+                    print(commonGroup + " not found. Try again.")
+
+        # All good, narrow to the common group, less the branch leading to the guess
+        state = state.applyClue(guess, group)
+        if book is not None:
+            book = book.get("n", {}).get(state.index.names[group].lower())
+
+
+# Instrument the hot paths if asked to by the environment, see instrument.py
+if instrument.enabledByEnv():
+    instrument.counters.enable(sys.modules[__name__])
 
-        # Cull the branch under the common group leading to the guess, since that was incorrect
-        groupList = findSpecies(tree, bestGuess)
-        for idx in range(len(groupList)):
-            if groupList[idx].lower() == commonGroup.lower():
-                cullGroup(tree, groupList[idx + 1].lower())
-                break
+################################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve Metazooa puzzles")
+    parser.add_argument(
+        "args",
+        nargs="*",
+        help='"metaflora" to play Metaflora, "batch" to solve every species, '
+        + '"book" to precompute every guess, "optimal" to find the best possible average, '
+        + '"probes" to see if guessing species that can\'t be the answer helps',
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=strategies.keys(),
+        default="largest",
+        help="the guess strategy",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="worker processes for batch mode, defaults to one per CPU",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="count and time calls to the tree operations and strategies, and report them on exit. "
+        + "Also enabled by setting "
+        + instrument.ENV_VAR,
+    )
+    # Both profilers watch every call, so only one can run at a time
+    profilers = parser.add_mutually_exclusive_group()
+    profilers.add_argument(
+        "--pstats", metavar="FILE", help="write cProfile stats for batch mode"
+    )
+    profilers.add_argument(
+        "--collapsed",
+        metavar="FILE",
+        help="write collapsed stacks for a flame graph of batch mode",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=5,
+        help="guesses to offer each turn when solving interactively, 1 for just the best",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=10000,
+        help="guesses to remember per process in batch and interactive mode, 0 to work every one out",
+    )
+    parser.add_argument(
+        "--persist-cache",
+        action="store_true",
+        help="also keep guesses on disk next to the tree, e.g. tree.guesses.db, for later runs. "
+        + "Batch mode only adds to it with --jobs 1",
+    )
+    args = parser.parse_args()
+    if args.profile:
+        instrument.counters.enable(sys.modules[__name__])
+    words = [word.lower() for word in args.args]
+
+    game = "metaflora" if "metaflora" in words else "metazooa"
+    treeFile, speciesFile = gameFiles[game]
+
+    # Every species is in play to start
+    state = loadGame(treeFile)
+
+    if "batch" in words:
+        with open(speciesFile) as file:
+            speciesList = json.load(file)["species"]
+        jobs = args.jobs
+        if (
+            instrument.counters.enabled
+            or args.pstats is not None
+            or args.collapsed is not None
+        ):
+            # Measurements are only taken in this process
+            jobs = 1
+        printBatch(
+            instrument.profileCall(
+                lambda: solveAll(
+                    state,
+                    speciesList,
+                    args.strategy,
+                    jobs,
+                    args.cache_size,
+                    treeFile if args.persist_cache else None,
+                ),
+                args.pstats,
+                args.collapsed,
+            )
+        )
+    elif "probes" in words:
+        with open(speciesFile) as file:
+            speciesList = json.load(file)["species"]
+        printProbes(state, speciesList, args.jobs)
+    elif "optimal" in words:
+        with open(speciesFile) as file:
+            speciesList = json.load(file)["species"]
+        printOptimal(state, speciesList)
+    elif "book" in words:
+        # Always rebuild, even if the cached book is current
+        if os.path.exists(bookFilename(treeFile, args.strategy)):
+            os.remove(bookFilename(treeFile, args.strategy))
+        start = time.perf_counter()
+        loadBook(treeFile, state, args.strategy, strategies[args.strategy])
+        print(
+            "Wrote "
+            + bookFilename(treeFile, args.strategy)
+            + " in {0:0.3f}s".format(time.perf_counter() - start)
+        )
+    else:
+        strategy = strategies[args.strategy]
+        book = loadBook(treeFile, state, args.strategy, strategy)
+        resolver = groupResolver.withSciNames(state.index, sciNameFiles[game])
+        # Off the book, states already seen are answered from the cache
+        cache = None
+        if 0 < args.cache_size:
+            cache = openGuessCache(
+                treeFile if args.persist_cache else None, args.cache_size
+            )
+            strategy = cache.wrap(args.strategy, strategy)
+        try:
+            interactive(state, strategy, book, resolver, args.strategy, args.top)
+        finally:
+            if cache is not None:
+                cache.close()
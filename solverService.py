@@ -0,0 +1,491 @@
+import argparse
+import asyncio
+import json
+import sys
+import uuid
+
+from gameState import gameState
+from openingBook import loadBook
+from groupNames import groupResolver
+from guessCache import guessCache
+from solver import (
+    gameFiles,
+    loadGame,
+    rankGuesses,
+    sciNameFiles,
+    scoreGuess,
+    strategies,
+)
+
+
+class gameSession:
+    def __init__(
+        self, game: str, strategyName: str, state: gameState, book: dict
+    ) -> None:
+        """Initialize one user's game
+
+        Args:
+            game (str): "metazooa" or "metaflora"
+            strategyName (str): A key of solver.strategies
+            state (gameState): The starting state, shared with every other session
+            book (dict): The opening book for the game and strategy, may be None
+        """
+        self.game = game
+        self.strategyName = strategyName
+        self.state = state
+        self.book = book
+        self.guesses: list[str] = []
+
+
+class sessionManager:
+    """Many concurrent games over one shared, read-only copy of each tree
+
+    Each tree and opening book is loaded the first time a game needs it. A
+    session only holds its own small gameState and its place in the book, so
+    thousands of them cost very little.
+    """
+
+    def __init__(self) -> None:
+        self.sessions: dict[str, gameSession] = {}
+        # Starting states by game, and books by (game, strategy)
+        self.startStates: dict[str, gameState] = {}
+        self.books: dict[tuple[str, str], dict] = {}
+        # Books being built on a worker thread, see prepare()
+        self.loading: dict[tuple[str, str], asyncio.Future] = {}
+        self.resolvers: dict[str, groupResolver] = {}
+        # Guesses off the book, shared by every session of a game
+        self.caches: dict[str, guessCache] = {}
+
+    def startState(self, game: str) -> gameState:
+        if game not in gameFiles:
+            raise ValueError("unknown game " + game)
+        if game not in self.startStates:
+            self.startStates[game] = loadGame(gameFiles[game][0])
+        return self.startStates[game]
+
+    def book(self, game: str, strategyName: str) -> dict:
+        key = (game, strategyName)
+        if key not in self.books:
+            self.books[key] = loadBook(
+                gameFiles[game][0],
+                self.startState(game),
+                strategyName,
+                strategies[strategyName],
+            )
+        return self.books[key]
+
+    async def prepare(self, request: dict):
+        """Build the book a create request needs on a worker thread, so the event loop keeps serving
+
+        Books for slow strategies like optimal can take seconds to build the
+        first time. Requests that can't be a valid create are left for
+        handleRequest to reject.
+
+        Args:
+            request (dict): The decoded request
+        """
+        if "create" != request.get("op"):
+            return
+        game = request.get("game", "metazooa")
+        strategyName = request.get("strategy", "largest")
+        if not (
+            isinstance(game, str)
+            and isinstance(strategyName, str)
+            and game in gameFiles
+            and strategyName in strategies
+        ):
+            return
+        key = (game, strategyName)
+        if key in self.books:
+            return
+        try:
+            if key not in self.loading:
+                # Loaded here first, so the worker thread only builds the book
+                state = self.startState(game)
+                self.loading[key] = asyncio.get_running_loop().run_in_executor(
+                    None,
+                    loadBook,
+                    gameFiles[game][0],
+                    state,
+                    strategyName,
+                    strategies[strategyName],
+                )
+            self.books[key] = await self.loading[key]
+        except Exception:
+            # handleRequest tries again and reports why it failed
+            pass
+        finally:
+            self.loading.pop(key, None)
+
+    def resolver(self, game: str) -> groupResolver:
+        if game not in self.resolvers:
+            self.resolvers[game] = groupResolver.withSciNames(
+                self.startState(game).index, sciNameFiles[game]
+            )
+        return self.resolvers[game]
+
+    def cache(self, game: str) -> guessCache:
+        if game not in self.caches:
+            self.caches[game] = guessCache()
+        return self.caches[game]
+
+    def session(self, sessionId: str) -> gameSession:
+        if sessionId not in self.sessions:
+            raise KeyError("unknown session " + str(sessionId))
+        return self.sessions[sessionId]
+
+    def createGame(self, game: str = "metazooa", strategyName: str = "largest") -> str:
+        """Start a new game
+
+        Args:
+            game (str, optional): "metazooa" or "metaflora". Defaults to "metazooa".
+            strategyName (str, optional): A key of solver.strategies. Defaults to "largest".
+
+        Raises:
+            ValueError: If the game or strategy is unknown
+
+        Returns:
+            str: The new session's ID
+        """
+        if strategyName not in strategies:
+            raise ValueError("unknown strategy " + strategyName)
+        state = self.startState(game)
+        sessionId = uuid.uuid4().hex
+        self.sessions[sessionId] = gameSession(
+            game, strategyName, state, self.book(game, strategyName)
+        )
+        return sessionId
+
+    def suggest(self, sessionId: str) -> str:
+        """Get the best guess for a game
+
+        Args:
+            sessionId (str): The session
+
+        Returns:
+            str: A species name to guess
+        """
+        session = self.session(sessionId)
+        if session.book is not None:
+            return session.book["g"]
+        # Other sessions may have been here already
+        cache = self.cache(session.game)
+        entry = cache.get(session.strategyName, session.state)
+        if entry is None:
+            entry = cache.put(
+                session.strategyName,
+                session.state,
+                strategies[session.strategyName](session.state),
+            )
+        return entry[0]
+
+    def rank(self, sessionId: str, k: int = 5) -> list[dict]:
+        """Get the best guesses for a game with their scores, for players who won't play the suggestion
+
+        Args:
+            sessionId (str): The session
+            k (int, optional): The most guesses to return. Defaults to 5.
+
+        Returns:
+            list[dict]: The suggested guess first, then the best of the rest, see solver.scoreGuess
+        """
+        session = self.session(sessionId)
+        state = session.state
+        suggestion = self.suggest(sessionId)
+        ranked = [scoreGuess(state, state.findSpecies(suggestion))] + [
+            r
+            for r in rankGuesses(state, session.strategyName, k)
+            if r["name"] != suggestion
+        ]
+        return ranked[:k]
+
+    def applyClue(self, sessionId: str, guess: str, commonGroup: str) -> int:
+        """Narrow a game with the common group reported for a guess
+
+        Args:
+            sessionId (str): The session
+            guess (str): The species that was guessed
+            commonGroup (str): The reported common group, case-insensitive
+
+        Raises:
+            ValueError: If the guess or group isn't in play, with the closest valid groups
+
+        Returns:
+            int: The number of species still possible
+        """
+        session = self.session(sessionId)
+        state = session.state
+        guessId = state.findSpecies(guess)
+        if -1 == guessId:
+            raise ValueError(guess + " is not a species in play")
+        # As the tree spells it, for the book and the game's history
+        guess = state.index.names[guessId]
+        resolver = self.resolver(session.game)
+        group = resolver.resolve(commonGroup, state, guessId)
+        if -1 == group:
+            suggestions = resolver.suggest(commonGroup, state, guessId)
+            if suggestions:
+                raise ValueError(
+                    commonGroup
+                    + " not found, did you mean "
+                    + " or ".join(suggestions[:3])
+                )
+            raise ValueError(commonGroup + " not found")
+        nextState = state.applyClue(guessId, group)
+
+        # Stay on the book only while following its suggestions
+        if session.book is not None and session.book["g"] == guess:
+            session.book = session.book.get("n", {}).get(
+                state.index.names[group].lower()
+            )
+        else:
+            session.book = None
+        session.state = nextState
+        session.guesses.append(guess)
+        return nextState.count
+
+    def complete(self, sessionId: str, prefix: str, k: int = 10) -> list[str]:
+        """Complete a partly typed group or species name, for clients' input boxes
+
+        Args:
+            sessionId (str): The session, for its game's names
+            prefix (str): The start of the name, case-insensitive
+            k (int, optional): The most names to return. Defaults to 10.
+
+        Returns:
+            list[str]: Matching names, as written in the tree, alphabetically
+        """
+        return self.resolver(self.session(sessionId).game).complete(prefix, k)
+
+    def candidates(self, sessionId: str) -> list[str]:
+        """List the species still possible in a game
+
+        Args:
+            sessionId (str): The session
+
+        Returns:
+            list[str]: The species names, in tree order
+        """
+        state = self.session(sessionId).state
+        return [state.index.names[leaf] for leaf in state.species()]
+
+    def endGame(self, sessionId: str):
+        self.session(sessionId)
+        del self.sessions[sessionId]
+
+
+# The type of each request argument, checked before the request is run
+fieldTypes = {
+    "session": str,
+    "game": str,
+    "strategy": str,
+    "guess": str,
+    "group": str,
+    "prefix": str,
+    "k": int,
+}
+
+
+def checkFields(request: dict):
+    """Check that a request's arguments have the right types
+
+    Args:
+        request (dict): The decoded request
+
+    Raises:
+        ValueError: If an argument has the wrong type
+    """
+    for name, fieldType in fieldTypes.items():
+        if name in request:
+            value = request[name]
+            # JSON true and false decode to bools, which are ints to Python
+            if isinstance(value, bool) or not isinstance(value, fieldType):
+                raise ValueError(
+                    name
+                    + " must be "
+                    + ("a string" if str == fieldType else "an integer")
+                )
+
+
+def handleRequest(manager: sessionManager, request: dict) -> dict:
+    """Run one request from the JSON lines protocol
+
+    Requests have an "op" and its arguments, and an optional "id" that's
+    echoed back:
+        {"op": "create", "game": "metazooa", "strategy": "largest"} -> {"session": ...}
+        {"op": "suggest", "session": ...} -> {"guess": ...}
+        {"op": "rank", "session": ..., "k": 5} -> {"guesses": [{"name": ..., "expected": ...}, ...]}
+        {"op": "clue", "session": ..., "guess": ..., "group": ...} -> {"remaining": ...}
+        {"op": "complete", "session": ..., "prefix": ..., "k": 10} -> {"names": [...]}
+        {"op": "candidates", "session": ...} -> {"candidates": [...]}
+        {"op": "end", "session": ...} -> {}
+        {"op": "stats"} -> {"cache": {game: {"hits": ..., "misses": ..., ...}}}
+    Every response has "ok", and "error" if it's false.
+
+    Args:
+        manager (sessionManager): The sessions
+        request (dict): The decoded request
+
+    Returns:
+        dict: The response
+    """
+    response = {"ok": True}
+    if "id" in request:
+        response["id"] = request["id"]
+    try:
+        checkFields(request)
+        op = request.get("op")
+        if "create" == op:
+            response["session"] = manager.createGame(
+                request.get("game", "metazooa"), request.get("strategy", "largest")
+            )
+        elif "suggest" == op:
+            response["guess"] = manager.suggest(request["session"])
+        elif "rank" == op:
+            response["guesses"] = manager.rank(request["session"], request.get("k", 5))
+        elif "clue" == op:
+            response["remaining"] = manager.applyClue(
+                request["session"], request["guess"], request["group"]
+            )
+        elif "complete" == op:
+            response["names"] = manager.complete(
+                request["session"], request["prefix"], request.get("k", 10)
+            )
+        elif "candidates" == op:
+            response["candidates"] = manager.candidates(request["session"])
+        elif "end" == op:
+            manager.endGame(request["session"])
+        elif "stats" == op:
+            response["cache"] = {
+                game: cache.stats() for game, cache in manager.caches.items()
+            }
+        else:
+            raise ValueError("unknown op " + str(op))
+    except (KeyError, ValueError) as e:
+        response["ok"] = False
+        response["error"] = str(e.args[0]) if e.args else repr(e)
+    return response
+
+
+def parseLine(line: bytes) -> tuple[dict, dict]:
+    """Decode one line of the JSON lines protocol
+
+    Args:
+        line (bytes): The line
+
+    Returns:
+        tuple[dict, dict]: The request, or None and the error response if it isn't one
+    """
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("request must be an object")
+    except ValueError as e:
+        return None, {"ok": False, "error": "bad request: " + str(e)}
+    return request, None
+
+
+def runRequest(manager: sessionManager, request: dict) -> bytes:
+    try:
+        response = handleRequest(manager, request)
+    except Exception as e:
+        # A bug handling one request mustn't take down every other session
+        response = {"ok": False, "error": "internal error: " + repr(e)}
+        if "id" in request:
+            response["id"] = request["id"]
+    return (json.dumps(response) + "\n").encode()
+
+
+def handleLine(manager: sessionManager, line: bytes) -> bytes:
+    request, response = parseLine(line)
+    if request is None:
+        return (json.dumps(response) + "\n").encode()
+    return runRequest(manager, request)
+
+
+async def handleLineAsync(manager: sessionManager, line: bytes) -> bytes:
+    """Like handleLine, but a book a create request needs is built without blocking other sessions
+
+    Args:
+        manager (sessionManager): The sessions
+        line (bytes): The request
+
+    Returns:
+        bytes: The response line
+    """
+    request, response = parseLine(line)
+    if request is None:
+        return (json.dumps(response) + "\n").encode()
+    await manager.prepare(request)
+    return runRequest(manager, request)
+
+
+async def serveStream(
+    manager: sessionManager, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+):
+    """Serve the JSON lines protocol on one connection
+
+    Args:
+        manager (sessionManager): The sessions, shared by every connection
+        reader (asyncio.StreamReader): Requests, one per line
+        writer (asyncio.StreamWriter): Responses, one per line
+    """
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                writer.write(await handleLineAsync(manager, line))
+                await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serveStdio(manager: sessionManager):
+    """Serve the JSON lines protocol on stdin and stdout
+
+    Args:
+        manager (sessionManager): The sessions
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        # stdin may be a file or a terminal, which can't always be watched
+        # by the event loop, so each line is read on a worker thread
+        line = await loop.run_in_executor(None, sys.stdin.buffer.readline)
+        if not line:
+            break
+        if line.strip():
+            sys.stdout.buffer.write(await handleLineAsync(manager, line))
+            sys.stdout.buffer.flush()
+
+
+async def serve(args):
+    manager = sessionManager()
+    # Load the trees up front so the first request isn't slow
+    for game in gameFiles.keys():
+        manager.book(game, "largest")
+
+    def onConnect(reader, writer):
+        return serveStream(manager, reader, writer)
+
+    if args.unix is not None:
+        server = await asyncio.start_unix_server(onConnect, args.unix)
+    elif args.tcp is not None:
+        host, port = args.tcp.rsplit(":", 1)
+        server = await asyncio.start_server(onConnect, host, int(port))
+    else:
+        await serveStdio(manager)
+        return
+
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve many concurrent games as line-delimited JSON, on stdin and stdout by default"
+    )
+    parser.add_argument("--tcp", metavar="HOST:PORT", help="listen on a TCP socket")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket")
+    asyncio.run(serve(parser.parse_args()))
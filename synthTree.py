@@ -0,0 +1,281 @@
+import argparse
+import json
+import math
+import random
+
+from solver import loadGame
+from treeIndex import treeIndex
+
+
+def sizeClass(share: float) -> int:
+    """Bucket clades by their share of the whole tree's species, halving each time
+
+    Args:
+        share (float): The clade's species over the tree's species
+
+    Returns:
+        int: 0 for the whole tree, 1 for half to a quarter of it, and so on
+    """
+    return int(math.log2(1 / share))
+
+
+def fitProfiles(index: treeIndex) -> tuple[dict[int, list[tuple[float, ...]]], float]:
+    """Get how each clade of a real tree splits its species between its children
+
+    Big clades split differently than small ones, mostly peeling off a few
+    species at a time, so the splits are kept by size class. Clades with one
+    child, named ranks in between splits, are counted separately.
+
+    Args:
+        index (treeIndex): The tree to fit to
+
+    Returns:
+        tuple[dict[int, list[tuple[float, ...]]], float]: For each sizeClass, the
+            share of species under each child of every clade that splits, and
+            the fraction of clades with one child
+    """
+    profiles: dict[int, list[tuple[float, ...]]] = {}
+    clades = 0
+    chains = 0
+    for node in range(len(index.names)):
+        if not index.isLeaf(node):
+            clades = clades + 1
+            total = index.leafCount[node]
+            profile = tuple(index.leafCount[c] / total for c in index.children(node))
+            if 1 == len(profile):
+                chains = chains + 1
+            else:
+                profiles.setdefault(sizeClass(total / index.leafCount[0]), []).append(
+                    profile
+                )
+    return profiles, chains / clades
+
+
+def fittedProfile(
+    rng: random.Random, profiles: dict[int, list[tuple[float, ...]]], share: float
+) -> tuple[float, ...]:
+    """Pick a real split for a clade of about the same relative size
+
+    Args:
+        rng (random.Random): The random source
+        profiles (dict[int, list[tuple[float, ...]]]): Splits from fitProfiles
+        share (float): The clade's species over the tree's species
+
+    Returns:
+        tuple[float, ...]: The share of species under each child
+    """
+    size = sizeClass(share)
+    nearest = min(profiles.keys(), key=lambda k: abs(k - size))
+    return rng.choice(profiles[nearest])
+
+
+def randomProfile(
+    rng: random.Random, minChildren: int, maxChildren: int, skew: float
+) -> tuple[float, ...]:
+    """Make up how a clade splits its species between its children
+
+    Args:
+        rng (random.Random): The random source
+        minChildren (int): The fewest children, at least 2
+        maxChildren (int): The most children
+        skew (float): 1 for roughly even splits, higher to give most species to one child
+
+    Returns:
+        tuple[float, ...]: The share of species under each child
+    """
+    weights = [
+        rng.random() ** skew for _ in range(rng.randint(minChildren, maxChildren))
+    ]
+    total = sum(weights)
+    return tuple(w / total for w in weights)
+
+
+def splitSpecies(numSpecies: int, profile: tuple[float, ...]) -> list[int]:
+    """Divide a clade's species between its children
+
+    Args:
+        numSpecies (int): The species in the clade, at least 2
+        profile (tuple[float, ...]): The share for each child
+
+    Returns:
+        list[int]: The species under each child, each at least 1, in profile order
+    """
+    # No more children than species, dropping the smallest shares
+    if numSpecies < len(profile):
+        keep = sorted(range(len(profile)), key=lambda i: -profile[i])[:numSpecies]
+        profile = tuple(profile[i] for i in sorted(keep))
+        total = sum(profile)
+        profile = tuple(p / total for p in profile)
+
+    # Every child gets one, the rest go by share, rounding remainders to the largest
+    spare = numSpecies - len(profile)
+    exact = [p * spare for p in profile]
+    sizes = [1 + int(e) for e in exact]
+    leftover = numSpecies - sum(sizes)
+    for i in sorted(range(len(profile)), key=lambda i: int(exact[i]) - exact[i])[
+        :leftover
+    ]:
+        sizes[i] = sizes[i] + 1
+    return sizes
+
+
+def fittedSource(index: treeIndex, rng: random.Random, chainRate: float = None):
+    """Split clades like a real tree's, for writeTree
+
+    Args:
+        index (treeIndex): The tree to fit to
+        rng (random.Random): The random source
+        chainRate (float, optional): The chance a clade has one child, fitted to the tree if None. Defaults to None.
+
+    Returns:
+        _type_: The profileFor function for writeTree
+    """
+    profiles, fittedRate = fitProfiles(index)
+    if chainRate is None:
+        chainRate = fittedRate
+
+    def profileFor(share: float) -> tuple[float, ...]:
+        if rng.random() < chainRate:
+            return (1.0,)
+        return fittedProfile(rng, profiles, share)
+
+    return profileFor
+
+
+def randomSource(
+    rng: random.Random,
+    minChildren: int,
+    maxChildren: int,
+    skew: float,
+    chainRate: float = 0.0,
+):
+    """Split clades with randomProfile, for writeTree
+
+    Args:
+        rng (random.Random): The random source
+        minChildren (int): The fewest children of a clade that splits, at least 2
+        maxChildren (int): The most children
+        skew (float): 1 for roughly even splits, higher to give most species to one child
+        chainRate (float, optional): The chance a clade has one child. Defaults to 0.0.
+
+    Returns:
+        _type_: The profileFor function for writeTree
+    """
+
+    def profileFor(share: float) -> tuple[float, ...]:
+        if rng.random() < chainRate:
+            return (1.0,)
+        return randomProfile(rng, minChildren, maxChildren, skew)
+
+    return profileFor
+
+
+def writeTree(file, numSpecies: int, profileFor, maxDepth: int = None) -> list[str]:
+    """Write a random tree in tree.json's format, streaming it so any size fits in memory
+
+    Args:
+        file (_type_): The file to write to
+        numSpecies (int): The number of species, the leaves of the tree
+        profileFor (_type_): Called with each clade's share of all species, returns its split profile
+        maxDepth (int, optional): Clades at this depth hold all their species directly. Defaults to None.
+
+    Returns:
+        list[str]: The species names, in tree order
+    """
+    species = []
+    nextId = 1
+    # Work left to do, popped from the end: species counts of nodes to write with
+    # their depth, or a string to write as is to separate or close them
+    stack: list = [(numSpecies, 0)]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            file.write(item)
+            continue
+
+        count, depth = item
+        nodeId = str(nextId)
+        nextId = nextId + 1
+        if 1 == count:
+            species.append("species " + nodeId)
+            file.write(
+                '{\n"name": "species ' + nodeId + '",\n"id": "' + nodeId + '"\n}\n'
+            )
+            continue
+
+        if maxDepth is not None and maxDepth <= depth + 1:
+            sizes = [1] * count
+        else:
+            sizes = splitSpecies(count, profileFor(count / numSpecies))
+        file.write(
+            '{\n"name": "Clade' + nodeId + '",\n"id": "' + nodeId + '",\n"children": ['
+        )
+        stack.append("]\n}\n")
+        for i in range(len(sizes) - 1, -1, -1):
+            stack.append((sizes[i], depth + 1))
+            if 0 != i:
+                stack.append(",")
+    return species
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write a random tree in tree.json's format, for testing the solver at scale"
+    )
+    parser.add_argument("species", type=int, help="the number of species")
+    parser.add_argument(
+        "--output", default="tree-synth.json", help="the tree file to write"
+    )
+    parser.add_argument(
+        "--species-output",
+        help="also write the species list in metazooa-species.json's format, for batch solving",
+    )
+    parser.add_argument(
+        "--fit",
+        default="tree.json",
+        help="split clades the way this tree's clades are split, unless --children is given",
+    )
+    parser.add_argument(
+        "--children",
+        type=int,
+        nargs=2,
+        metavar=("MIN", "MAX"),
+        help="pick each clade's number of children uniformly from MIN to MAX instead",
+    )
+    parser.add_argument(
+        "--skew",
+        type=float,
+        default=3.0,
+        help="with --children, how unevenly species are split, 1 is about even",
+    )
+    parser.add_argument(
+        "--chain",
+        type=float,
+        help="the chance each clade has one child, like a rank between splits. "
+        + "Fitted with --fit, 0 with --children",
+    )
+    parser.add_argument("--max-depth", type=int, help="the deepest a species can be")
+    parser.add_argument("--seed", type=int, default=0, help="the random seed")
+    args = parser.parse_args()
+
+    if args.species < 1:
+        parser.error("there must be at least one species")
+    if args.chain is not None and not 0 <= args.chain < 1:
+        parser.error("--chain must be at least 0 and less than 1")
+    rng = random.Random(args.seed)
+    if args.children is not None:
+        if args.children[0] < 2 or args.children[1] < args.children[0]:
+            parser.error("--children needs 2 <= MIN <= MAX")
+        profileFor = randomSource(
+            rng, args.children[0], args.children[1], args.skew, args.chain or 0.0
+        )
+    else:
+        profileFor = fittedSource(loadGame(args.fit).index, rng, args.chain)
+
+    with open(args.output, "w") as file:
+        species = writeTree(file, args.species, profileFor, args.max_depth)
+    print("Wrote " + args.output + " with " + str(len(species)) + " species")
+
+    if args.species_output is not None:
+        with open(args.species_output, "w") as file:
+            json.dump({"species": species}, file, indent=2)
@@ -0,0 +1,491 @@
+import hashlib
+import json
+import mmap
+import os
+from array import array
+from bisect import bisect_left
+from operator import itemgetter
+
+# Bump when the layout of the cache files changes
+CACHE_VERSION = 2
+
+# Name classes in names.dmp that can be looked up, besides the scientific name
+lookupClasses = {b"scientific name", b"synonym", b"equivalent name", b"genbank synonym"}
+
+
+def sourceStamps(namesPath: str, nodesPath: str) -> dict:
+    """Get the size and modification time of the dump files, to tell if a cache is stale
+
+    Args:
+        namesPath (str): The path to names.dmp
+        nodesPath (str): The path to nodes.dmp
+
+    Returns:
+        dict: [size, mtime_ns] for each file by name
+    """
+    stamps = {}
+    for path in (namesPath, nodesPath):
+        stat = os.stat(path)
+        stamps[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+
+def normalizeSciName(name: bytes) -> bytes:
+    """Fold a scientific name to the form it's looked up by
+
+    Case and spacing are ignored, and so are hybrid markers, so "Citrus x limon"
+    and "Citrus limon" are the same name.
+
+    Args:
+        name (bytes): The name, UTF-8 encoded
+
+    Returns:
+        bytes: The lowercase words of the name, without "x" or "×", joined by single spaces
+    """
+    return b" ".join(w for w in name.lower().split() if w != b"x" and w != "×".encode())
+
+
+def keyHash(key: bytes) -> int:
+    """Hash a normalized name for the lookup table, never 0
+
+    Args:
+        key (bytes): The name from normalizeSciName
+
+    Returns:
+        int: A 64-bit hash
+    """
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+def resolveMatches(
+    matches: dict[str, list[int]],
+) -> tuple[dict[str, int], list[str], dict[str, list[int]]]:
+    """Pick a tax_id for each name from the nodes it matched
+
+    A scientific name beats a synonym. If a name is the scientific name of
+    several nodes, or only a synonym of several, the lowest tax_id is used,
+    which is the first in names.dmp, and it's reported as ambiguous.
+
+    Args:
+        matches (dict[str, list[int]]): The tax_ids each name matched, negated for
+            names other than the scientific name
+
+    Returns:
+        tuple[dict[str, int], list[str], dict[str, list[int]]]: The tax_id picked for
+            each name, the names that matched nothing, and the candidates of each
+            ambiguous name, the one picked first
+    """
+    resolved: dict[str, int] = {}
+    unresolved: list[str] = []
+    ambiguous: dict[str, list[int]] = {}
+    for name, ids in matches.items():
+        scientific = sorted({i for i in ids if 0 < i})
+        candidates = scientific or sorted({-i for i in ids if i < 0})
+        if not candidates:
+            unresolved.append(name)
+            continue
+        resolved[name] = candidates[0]
+        if 1 < len(candidates):
+            ambiguous[name] = candidates
+    return resolved, unresolved, ambiguous
+
+
+def iterDmp(path: str, columns: tuple, chunkSize: int = 1 << 22):
+    """Read the rows of a .dmp file in large binary chunks, keeping only some columns
+
+    Rows end with "\\t|\\n" and columns are split by "\\t|\\t", so no regex is needed
+    and columns that aren't asked for are never decoded.
+
+    Args:
+        path (str): The .dmp file
+        columns (tuple): The indices of the columns to keep, at least two
+        chunkSize (int, optional): The bytes to read at once. Defaults to 4 MiB.
+
+    Yields:
+        tuple[bytes, ...]: The requested columns of each row, as bytes
+    """
+    lastColumn = max(columns)
+    pick = itemgetter(*columns)
+    linesProc = 0
+    with open(path, "rb") as file:
+        leftover = b""
+        while True:
+            chunk = file.read(chunkSize)
+            if not chunk:
+                break
+            chunk = leftover + chunk
+            # Only whole rows, the partial one at the end waits for the next chunk
+            end = chunk.rfind(b"\n") + 1
+            leftover = chunk[end:]
+            rows = chunk[:end].split(b"\t|\n")
+            rows.pop()
+            for row in rows:
+                yield pick(row.split(b"\t|\t", lastColumn + 1))
+
+            # Progress
+            if linesProc // 1000000 != (linesProc + len(rows)) // 1000000:
+                print(
+                    str((linesProc + len(rows)) // 1000000 * 1000000)
+                    + " lines processed"
+                )
+            linesProc = linesProc + len(rows)
+        if leftover.strip():
+            raise ValueError(path + " ends with a partial row")
+
+
+def iterNames(path: str, nameClass: bytes = b"scientific name"):
+    """Read names.dmp
+
+    Args:
+        path (str): The path to names.dmp
+        nameClass (bytes, optional): Only yield names of this class, None for all. Defaults to b"scientific name".
+
+    Yields:
+        tuple[int, str, str]: The tax_id, name_txt and name_class of each row
+    """
+    for tax_id, name_txt, name_class in iterDmp(path, (0, 1, 3)):
+        if nameClass is None or nameClass == name_class:
+            yield int(tax_id), name_txt.decode(), name_class.decode()
+
+
+def matchNames(path: str, names: list[str]) -> dict[str, list[int]]:
+    """Find nodes by scientific name or synonym with one pass over names.dmp
+
+    Only the names asked for are kept, so this works without the cache.
+
+    Args:
+        path (str): The path to names.dmp
+        names (list[str]): The names to find
+
+    Returns:
+        dict[str, list[int]]: The tax_ids each name matched, negated for synonyms, see resolveMatches
+    """
+    targets: dict[bytes, list[str]] = {}
+    for name in names:
+        targets.setdefault(normalizeSciName(name.encode()), []).append(name)
+    matches: dict[str, list[int]] = {name: [] for name in names}
+    for tax_id, nameBytes, name_class in iterDmp(path, (0, 1, 3)):
+        if name_class in lookupClasses:
+            key = normalizeSciName(nameBytes)
+            if key in targets:
+                tax_id = (
+                    int(tax_id) if b"scientific name" == name_class else -int(tax_id)
+                )
+                for name in targets[key]:
+                    matches[name].append(tax_id)
+    return matches
+
+
+def iterNodes(path: str):
+    """Read nodes.dmp
+
+    Args:
+        path (str): The path to nodes.dmp
+
+    Yields:
+        tuple[int, int, str]: The tax_id, parent_tax_id and rank of each row
+    """
+    for tax_id, parent_tax_id, rank in iterDmp(path, (0, 1, 2)):
+        yield int(tax_id), int(parent_tax_id), rank.decode()
+
+
+def readNodeColumns(path: str) -> tuple[array, array, list[str]]:
+    """Read nodes.dmp into flat columns indexed by tax_id
+
+    Args:
+        path (str): The path to nodes.dmp
+
+    Returns:
+        tuple[array, array, list[str]]: The int32 parent of each tax_id (0 where
+            there's no node), the uint8 rank code of each tax_id, and the rank
+            name for each code
+    """
+    parents = array("i")
+    ranks = array("B")
+    rankCodes: dict[bytes, int] = {}
+    maxTaxId = 0
+    for tax_id, parent_tax_id, rank in iterDmp(path, (0, 1, 2)):
+        tax_id = int(tax_id)
+        if len(parents) <= tax_id:
+            # Grow geometrically, tax_ids are mostly increasing
+            grow = max(tax_id + 1 - len(parents), len(parents))
+            parents.extend([0] * grow)
+            ranks.extend([0] * grow)
+        maxTaxId = max(maxTaxId, tax_id)
+        parents[tax_id] = int(parent_tax_id)
+        ranks[tax_id] = rankCodes.setdefault(rank, len(rankCodes))
+
+    # Drop the slack left by growing
+    del parents[maxTaxId + 1 :]
+    del ranks[maxTaxId + 1 :]
+    return parents, ranks, [rank.decode() for rank in rankCodes.keys()]
+
+
+def writeArray(cacheDir: str, filename: str, values: array):
+    with open(os.path.join(cacheDir, filename), "wb") as file:
+        values.tofile(file)
+
+
+def buildTaxCache(namesPath: str, nodesPath: str, cacheDir: str):
+    """Convert names.dmp and nodes.dmp into a memory-mappable binary cache
+
+    The cache is a few flat files, all indexed by tax_id:
+        parents.bin: int32 parent tax_id, 0 where there's no node
+        ranks.bin: uint8 rank code, an index into meta.json's ranks
+        nameStarts.bin, nameLengths.bin: int64 offset and uint32 length of the
+            scientific name in names.blob
+        nameOrder.bin: int32 tax_ids sorted by scientific name, for lookups by name
+        lookup*.bin, lookup.blob: a hash table from every normalizeSciName'd
+            scientific name and synonym to tax_ids, see taxCache.matchNames
+
+    Args:
+        namesPath (str): The path to names.dmp
+        nodesPath (str): The path to nodes.dmp
+        cacheDir (str): The directory to write the cache to
+    """
+    os.makedirs(cacheDir, exist_ok=True)
+
+    # One pass over nodes.dmp for the parent and rank of every node
+    parents, ranks, rankNames = readNodeColumns(nodesPath)
+    writeArray(cacheDir, "parents.bin", parents)
+    writeArray(cacheDir, "ranks.bin", ranks)
+
+    # One pass over names.dmp, appending scientific names to the blob as they come
+    nameStarts = array("q", [0]) * len(parents)
+    nameLengths = array("I", [0]) * len(parents)
+    named: list[tuple[bytes, int]] = []
+    # And every name that can be looked up, normalized, as rows of the lookup table
+    keyHashes = array("Q")
+    keyIds = array("i")
+    keyStarts = array("q")
+    keyLengths = array("I")
+    with open(os.path.join(cacheDir, "names.blob"), "wb") as blob, open(
+        os.path.join(cacheDir, "lookup.blob"), "wb"
+    ) as keyBlob:
+        offset = 0
+        keyOffset = 0
+        for tax_id, nameBytes, name_class in iterDmp(namesPath, (0, 1, 3)):
+            if name_class in lookupClasses:
+                key = normalizeSciName(nameBytes)
+                keyHashes.append(keyHash(key))
+                # Synonyms are negated, so scientific names can win
+                keyIds.append(
+                    int(tax_id) if b"scientific name" == name_class else -int(tax_id)
+                )
+                keyStarts.append(keyOffset)
+                keyLengths.append(len(key))
+                keyBlob.write(key)
+                keyOffset = keyOffset + len(key)
+            if b"scientific name" == name_class:
+                tax_id = int(tax_id)
+                if tax_id < len(parents):
+                    nameStarts[tax_id] = offset
+                    nameLengths[tax_id] = len(nameBytes)
+                    named.append((nameBytes, tax_id))
+                blob.write(nameBytes)
+                offset = offset + len(nameBytes)
+
+    writeArray(cacheDir, "nameStarts.bin", nameStarts)
+    writeArray(cacheDir, "nameLengths.bin", nameLengths)
+    named.sort()
+    writeArray(cacheDir, "nameOrder.bin", array("i", [t for _, t in named]))
+
+    # Open addressing with linear probing, at most half full, each slot a row or -1
+    size = 2
+    while size < 2 * len(keyHashes):
+        size = size * 2
+    mask = size - 1
+    slots = array("i", [-1]) * size
+    for row, h in enumerate(keyHashes):
+        pos = h & mask
+        while -1 != slots[pos]:
+            pos = (pos + 1) & mask
+        slots[pos] = row
+    writeArray(cacheDir, "lookupSlots.bin", slots)
+    writeArray(cacheDir, "lookupHashes.bin", keyHashes)
+    writeArray(cacheDir, "lookupIds.bin", keyIds)
+    writeArray(cacheDir, "lookupStarts.bin", keyStarts)
+    writeArray(cacheDir, "lookupLengths.bin", keyLengths)
+
+    # Written last, so a cache interrupted mid-build is never seen as current
+    with open(os.path.join(cacheDir, "meta.json"), "w") as file:
+        json.dump(
+            {
+                "version": CACHE_VERSION,
+                "sources": sourceStamps(namesPath, nodesPath),
+                "ranks": rankNames,
+            },
+            file,
+        )
+
+
+def isCacheCurrent(namesPath: str, nodesPath: str, cacheDir: str) -> bool:
+    """Check if a cache was built from the dump files as they are now
+
+    Args:
+        namesPath (str): The path to names.dmp
+        nodesPath (str): The path to nodes.dmp
+        cacheDir (str): The cache directory
+
+    Returns:
+        bool: True if the cache exists and matches the dump files
+    """
+    try:
+        with open(os.path.join(cacheDir, "meta.json")) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return False
+    if CACHE_VERSION != meta.get("version"):
+        return False
+    if not (os.path.exists(namesPath) and os.path.exists(nodesPath)):
+        # The dumps were deleted after conversion, the cache is all there is
+        return True
+    return meta["sources"] == sourceStamps(namesPath, nodesPath)
+
+
+class taxCache:
+    def __init__(self, cacheDir: str) -> None:
+        """Open a cache written by buildTaxCache. Nothing is read until it's used
+
+        Args:
+            cacheDir (str): The cache directory
+        """
+        self.cacheDir = cacheDir
+        with open(os.path.join(cacheDir, "meta.json")) as file:
+            self.rankNames: list[str] = json.load(file)["ranks"]
+        self.parents = self.mapFile("parents.bin", "i")
+        self.ranks = self.mapFile("ranks.bin", "B")
+        self.nameStarts = self.mapFile("nameStarts.bin", "q")
+        self.nameLengths = self.mapFile("nameLengths.bin", "I")
+        self.nameOrder = self.mapFile("nameOrder.bin", "i")
+        self.blob = self.mapFile("names.blob", "B")
+        self.lookupSlots = self.mapFile("lookupSlots.bin", "i")
+        self.lookupHashes = self.mapFile("lookupHashes.bin", "Q")
+        self.lookupIds = self.mapFile("lookupIds.bin", "i")
+        self.lookupStarts = self.mapFile("lookupStarts.bin", "q")
+        self.lookupLengths = self.mapFile("lookupLengths.bin", "I")
+        self.lookupBlob = self.mapFile("lookup.blob", "B")
+
+    def mapFile(self, filename: str, typecode: str) -> memoryview:
+        """Memory-map one of the cache files as a typed array
+
+        Args:
+            filename (str): The file in the cache directory
+            typecode (str): The array typecode of the file's elements
+
+        Returns:
+            memoryview: A read-only view of the file's elements
+        """
+        with open(os.path.join(self.cacheDir, filename), "rb") as file:
+            if 0 == os.fstat(file.fileno()).st_size:
+                # Empty files can't be mapped
+                return memoryview(b"").cast(typecode)
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mapped).cast(typecode)
+
+    def hasNode(self, tax_id: int) -> bool:
+        return 0 <= tax_id < len(self.parents) and 0 != self.parents[tax_id]
+
+    def parent(self, tax_id: int) -> int:
+        return self.parents[tax_id]
+
+    def rank(self, tax_id: int) -> str:
+        return self.rankNames[self.ranks[tax_id]]
+
+    def nameBytes(self, tax_id: int) -> bytes:
+        start = self.nameStarts[tax_id]
+        return bytes(self.blob[start : start + self.nameLengths[tax_id]])
+
+    def sciName(self, tax_id: int) -> str:
+        """Get a node's scientific name
+
+        Args:
+            tax_id (int): The node's tax_id
+
+        Returns:
+            str: The scientific name
+        """
+        return self.nameBytes(tax_id).decode()
+
+    def find(self, sciName: str) -> int:
+        """Find a node by its exact scientific name
+
+        Args:
+            sciName (str): The scientific name
+
+        Returns:
+            int: The tax_id, or -1 if there's no node with that name
+        """
+        target = sciName.encode()
+        pos = bisect_left(self.nameOrder, target, key=self.nameBytes)
+        if pos < len(self.nameOrder) and self.nameBytes(self.nameOrder[pos]) == target:
+            return self.nameOrder[pos]
+        return -1
+
+    def matchNames(self, names: list[str]) -> dict[str, list[int]]:
+        """Find nodes by scientific name or synonym, ignoring case, spacing and hybrid markers
+
+        Each name is one probe of the hash table, O(1) however big the taxdump is.
+
+        Args:
+            names (list[str]): The names to find
+
+        Returns:
+            dict[str, list[int]]: The tax_ids each name matched, negated for synonyms, see resolveMatches
+        """
+        matches: dict[str, list[int]] = {}
+        mask = len(self.lookupSlots) - 1
+        for name in names:
+            key = normalizeSciName(name.encode())
+            h = keyHash(key)
+            ids = []
+            pos = h & mask
+            while -1 != self.lookupSlots[pos]:
+                row = self.lookupSlots[pos]
+                if self.lookupHashes[row] == h:
+                    start = self.lookupStarts[row]
+                    if (
+                        bytes(self.lookupBlob[start : start + self.lookupLengths[row]])
+                        == key
+                    ):
+                        ids.append(self.lookupIds[row])
+                pos = (pos + 1) & mask
+            matches[name] = ids
+        return matches
+
+    def lineage(self, tax_id: int) -> list[int]:
+        """Get the tax_ids from the root down to a node
+
+        Args:
+            tax_id (int): The node's tax_id
+
+        Returns:
+            list[int]: The chain of tax_ids, starting with 1
+        """
+        chain = [tax_id]
+        while 1 != tax_id:
+            tax_id = self.parents[tax_id]
+            chain.append(tax_id)
+        chain.reverse()
+        return chain
+
+
+def openTaxCache(
+    namesPath: str = "names.dmp",
+    nodesPath: str = "nodes.dmp",
+    cacheDir: str = "taxcache",
+) -> taxCache:
+    """Open the binary cache of the taxdump, converting the dump files first if needed
+
+    Args:
+        namesPath (str, optional): The path to names.dmp. Defaults to "names.dmp".
+        nodesPath (str, optional): The path to nodes.dmp. Defaults to "nodes.dmp".
+        cacheDir (str, optional): The cache directory. Defaults to "taxcache".
+
+    Returns:
+        taxCache: The opened cache
+    """
+    if not isCacheCurrent(namesPath, nodesPath, cacheDir):
+        print("Converting taxdump to " + cacheDir)
+        buildTaxCache(namesPath, nodesPath, cacheDir)
+    return taxCache(cacheDir)
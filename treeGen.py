@@ -1,6 +1,20 @@
+import hashlib
 import re
 import json
+import os
 import sys
+from array import array
+
+from taxDump import (
+    iterNames,
+    matchNames,
+    openTaxCache,
+    readNodeColumns,
+    resolveMatches,
+    taxCache,
+)
+from treeIndex import treeIndex
+from treeWalk import nodeChildren, preorder, walk
 
 
 class taxName:
@@ -57,7 +71,8 @@ class treeNode:
         """
         self.tax_id = tax_id
         self.children: list[treeNode] = []
-        pass
+        # The same children by tax_id, so finding one doesn't scan the list
+        self.childIndex: dict[int, treeNode] = {}
 
     def addChild(self, child):
         """Add a child to this node
@@ -65,8 +80,9 @@ class treeNode:
         Args:
             child (treeNode): The child to add
         """
-        if child not in self.children:
+        if child.tax_id not in self.childIndex:
             self.children.append(child)
+            self.childIndex[child.tax_id] = child
 
     def addToTree(self, tax_id_chain: list[int]):
         """Add a list of IDs to a tree
@@ -78,17 +94,12 @@ class treeNode:
         root: treeNode = self
         # For each index in the ID chain, except the last
         for idx in range(len(tax_id_chain) - 1):
-            found = False
-            # Check all this node's children
-            for child in root.children:
-                # If the next ID is a child's ID
-                if tax_id_chain[idx + 1] == child.tax_id:
-                    # Move to that child and continue
-                    found = True
-                    root = child
-                    break
+            # If the next ID is a child's ID, move to that child and continue
+            child = root.childIndex.get(tax_id_chain[idx + 1])
+            if child is not None:
+                root = child
             # If a child with this ID was not found
-            if not found:
+            else:
                 # Create a new child, add it, and continue
                 newNode = treeNode(tax_id_chain[idx + 1])
                 root.addChild(newNode)
@@ -96,78 +107,100 @@ class treeNode:
 
     def compressTree(self):
         """Compress a tree by removing children that only have one child"""
-        # While there is only one child
-        while 1 == len(self.children):
-            if 0 == len(self.children[0].children):
-                # species, steal the ID
-                self.tax_id = self.children[0].tax_id
-                self.children.clear()
-                break
-            else:
-                # Clade, compress it
-                self.children = self.children[0].children
-
-        # Multiple children, compress them
-        for child in self.children:
-            child.compressTree()
+        # Each node is compressed before its children are visited
+        for node in preorder(self, nodeChildren):
+            # While there is only one child
+            while 1 == len(node.children):
+                if 0 == len(node.children[0].children):
+                    # species, steal the ID
+                    node.tax_id = node.children[0].tax_id
+                    node.children.clear()
+                    node.childIndex.clear()
+                    break
+                else:
+                    # Clade, compress it
+                    node.childIndex = node.children[0].childIndex
+                    node.children = node.children[0].children
 
-    def addNamesToTree(self, nameDict: dict[int, str], mzNames):
+    def addNamesToTree(self, nameDict: dict[int, str], speciesNames: dict[int, str]):
         """Add names to the nodes in the tree
 
         Args:
             nameDict (dict[int, str]): A dictionary from taxonomic ID to scientific name
-            mzNames (_type_): A JSON object of metazooa names
+            speciesNames (dict[int, str]): A dictionary from taxonomic ID to metazooa name, see speciesByTaxId()
         """
-        # If this node has no children, print the common name
-        if 0 == len(self.children):
-            # Find the common name in mzNames by matching tax_id
-            for species in mzNames["species"]:
-                if species["tax_id"] == self.tax_id:
-                    self.name = species["name"]
-                    break
-        else:
-            # Node has children, write the scientific name
-            if self.tax_id == 7776:
-                self.name = "Gnathostomata"
-            elif self.tax_id == 35060:
-                self.name = "Gnathostomata-urchin"
+        for node in preorder(self, nodeChildren):
+            # If this node has no children, print the common name
+            if 0 == len(node.children):
+                # Find the common name by tax_id
+                if node.tax_id in speciesNames:
+                    node.name = speciesNames[node.tax_id]
             else:
-                self.name = nameDict[self.tax_id]
-
-        # For all children
-        for child in self.children:
-            # Assign names recursively
-            child.addNamesToTree(nameDict, mzNames)
+                # Node has children, write the scientific name
+                if node.tax_id == 7776:
+                    node.name = "Gnathostomata"
+                elif node.tax_id == 35060:
+                    node.name = "Gnathostomata-urchin"
+                else:
+                    node.name = nameDict[node.tax_id]
 
-    def printTreeDot(self, file):
+    def printTreeDot(self, file, speciesNames: dict[int, str]):
         """Print a tree in graphviz form
 
         Args:
             file (_type_): The file to write to
+            speciesNames (dict[int, str]): A dictionary from taxonomic ID to metazooa name, see speciesByTaxId()
         """
-        # If this node has no children, print the common name
-        if 0 == len(self.children):
-            # Find the common name in mzNames by matching tax_id
-            for species in mzNames["species"]:
-                if species["tax_id"] == self.tax_id:
+        # The nodes being drawn, down to the parent of the one entered
+        parents = []
+        for node, children in walk(self, nodeChildren):
+            if children is None:
+                parents.pop()
+                continue
+
+            # Draw the link from the parent, before the node's own subtree
+            link = ""
+            if parents:
+                link = str(parents[-1].tax_id) + " -> " + str(node.tax_id) + "\n"
+
+            # If this node has no children, print the common name
+            if not children:
+                # Only species metazooa knows about are drawn
+                if node.tax_id in speciesNames:
                     # Found the name, write it
                     file.write(
-                        str(self.tax_id)
+                        link
+                        + str(node.tax_id)
                         + ' [label="'
-                        + self.name
+                        + node.name
                         + '" style=filled fillcolor="gold"]\n'
                     )
-                    break
-        else:
-            # Node has children, write the scientific name
-            file.write(str(self.tax_id) + ' [label="' + self.name + '"]\n')
+                elif link:
+                    file.write(link)
+            else:
+                # Node has children, write the scientific name
+                file.write(link + str(node.tax_id) + ' [label="' + node.name + '"]\n')
+                parents.append(node)
+
+    def toIndex(self) -> treeIndex:
+        """Compile the tree into the solver's index
 
-        # For all children
-        for child in self.children:
-            # Draw the link to the child
-            file.write(str(self.tax_id) + " -> " + str(child.tax_id) + "\n")
-            # Print recursively
-            child.printTreeDot(file)
+        Returns:
+            treeIndex: The compiled index, with IDs in the same order as printTreeJson
+        """
+        parent: list[int] = []
+        names: list[str] = []
+        taxIds: list[str] = []
+        stack = [(self, -1)]
+        while stack:
+            node, p = stack.pop()
+            parent.append(p)
+            names.append(node.name)
+            taxIds.append(str(node.tax_id))
+            me = len(parent) - 1
+            for child in reversed(node.children):
+                stack.append((child, me))
+        return treeIndex(parent, names, taxIds)
 
     def printTreeJson(self, file):
         """Print a tree in json form
@@ -175,137 +208,291 @@ class treeNode:
         Args:
             file (_type_): The file to write to
         """
+        # A node entered right after another was left has a sibling before it
+        separator = ""
+        for node, children in walk(self, nodeChildren):
+            if children is None:
+                # Leaving a node with children
+                file.write("]\n}\n")
+                separator = ","
+                continue
+            # One write per node, they add up on big trees
+            text = (
+                separator
+                + '{\n"name": "'
+                + node.name
+                + '",\n"id": "'
+                + str(node.tax_id)
+                + '"'
+            )
+            if children:
+                file.write(text + ',\n"children": [')
+                separator = ""
+            else:
+                file.write(text + "\n}\n")
+                separator = ","
 
-        file.write("{\n")
-        file.write('"name": "' + self.name + '",\n')
-        file.write('"id": "' + str(self.tax_id) + '"')
-        if 0 < len(self.children):
-            file.write(',\n"children": [')
 
-            first = True
-            for child in self.children:
-                if first:
-                    first = False
-                else:
-                    file.write(",")
-                child.printTreeJson(file)
-            file.write("]\n")
-        else:
-            file.write("\n")
+# Names in names.dmp that metazooa knows by another name. Fix lemons and limes
+sciNameFixes = {
+    "Citrus x limon": "Citrus limon",
+    "Citrus x aurantiifolia": "Citrus aurantiifolia",
+}
+
+
+def fixSciName(name_txt: str) -> str:
+    """Rename hybrids to the names metazooa uses
+
+    Args:
+        name_txt (str): A name from names.dmp
+
+    Returns:
+        str: The name metazooa knows it by
+    """
+    return sciNameFixes.get(name_txt, name_txt)
+
+
+def speciesByTaxId(mzNames) -> dict[int, str]:
+    """Map tax_ids to metazooa names, once, so naming the tree doesn't search the list per leaf
+
+    Args:
+        mzNames (_type_): A JSON object of metazooa names, with tax_ids linked
+
+    Returns:
+        dict[int, str]: A dictionary from taxonomic ID to metazooa name
+    """
+    speciesNames: dict[int, str] = {}
+    for species in mzNames["species"]:
+        # The first species with a tax_id wins, like the list search did
+        if "tax_id" in species:
+            speciesNames.setdefault(species["tax_id"], species["name"])
+    return speciesNames
+
+
+def linkMatches(
+    mzNames, matches: dict[str, list[int]]
+) -> tuple[list[str], dict[str, list[int]]]:
+    """Set the tax_id of each metazooa species from the nodes its scientific name matched
+
+    Args:
+        mzNames (_type_): A JSON object of metazooa names
+        matches (dict[str, list[int]]): What each scientific name matched, from matchNames
+
+    Returns:
+        tuple[list[str], dict[str, list[int]]]: The scientific names that matched
+            nothing, and the candidates of those that matched several nodes
+    """
+    resolved, unresolved, ambiguous = resolveMatches(matches)
+    for mzName in mzNames["species"]:
+        if mzName["sciName"] in resolved:
+            mzName["tax_id"] = resolved[mzName["sciName"]]
+    return unresolved, ambiguous
+
+
+def linkSpeciesCached(
+    cache: taxCache, mzNames
+) -> tuple[list[str], dict[str, list[int]]]:
+    """Set the tax_id of each metazooa species from the binary taxdump cache
+
+    Args:
+        cache (taxCache): The opened cache
+        mzNames (_type_): A JSON object of metazooa names
+
+    Returns:
+        tuple[list[str], dict[str, list[int]]]: See linkMatches
+    """
+    return linkMatches(
+        mzNames, cache.matchNames([s["sciName"] for s in mzNames["species"]])
+    )
+
+
+def linkSpecies(filename: str, mzNames) -> tuple[list[str], dict[str, list[int]]]:
+    """Set the tax_id of each metazooa species with one pass over names.dmp
+
+    Args:
+        filename (str): The path to names.dmp
+        mzNames (_type_): A JSON object of metazooa names
+
+    Returns:
+        tuple[list[str], dict[str, list[int]]]: See linkMatches
+    """
+    return linkMatches(
+        mzNames, matchNames(filename, [s["sciName"] for s in mzNames["species"]])
+    )
+
+
+def reportLinks(mzNames, unresolved: list[str], ambiguous: dict[str, list[int]]):
+    """Print the species that couldn't be linked, or were linked to one of several nodes
+
+    Args:
+        mzNames (_type_): A JSON object of metazooa names
+        unresolved (list[str]): Scientific names that matched nothing
+        ambiguous (dict[str, list[int]]): Scientific names that matched several nodes, to their tax_ids
+    """
+    unresolved = set(unresolved)
+    for mzName in mzNames["species"]:
+        sciName = mzName["sciName"]
+        if sciName in unresolved:
+            print(
+                mzName["name"]
+                + " ("
+                + sciName
+                + ") was not found in the taxdump, left out"
+            )
+        elif sciName in ambiguous:
+            print(
+                mzName["name"]
+                + " ("
+                + sciName
+                + ") matches tax_ids "
+                + ", ".join(str(t) for t in ambiguous[sciName])
+                + ", using the first"
+            )
+
+
+def loadParents(filename: str) -> array:
+    """Load the parent of every taxonomic node with one pass over nodes.dmp
+
+    Args:
+        filename (str): The path to nodes.dmp
+
+    Returns:
+        array: Parent tax_ids indexed by tax_id, 0 where there's no node
+    """
+    return readNodeColumns(filename)[0]
+
+
+def loadSciNames(filename: str, tax_ids: set[int]) -> dict[int, str]:
+    """Load the scientific names of only the given nodes with one pass over names.dmp
+
+    Args:
+        filename (str): The path to names.dmp
+        tax_ids (set[int]): The tax_ids to keep names for
+
+    Returns:
+        dict[int, str]: A dictionary from taxonomic ID to scientific name
+    """
+    nameDict: dict[int, str] = {}
+    for tax_id, name_txt, _ in iterNames(filename):
+        if tax_id in tax_ids:
+            nameDict[tax_id] = fixSciName(name_txt)
+    return nameDict
+
+
+def main():
+    useMetazooa = True
+    if 1 < len(sys.argv):
+        if "metaflora" == sys.argv[1].lower():
+            useMetazooa = False
+
+    # Parse the text dumps directly instead of through the binary cache
+    useCache = "--no-cache" not in sys.argv
+
+    # Read a list of all scientific names for metazooa species
+    if useMetazooa:
+        with open("sciNames.json") as file:
+            mzNames = json.load(file)
+    else:
+        with open("sciNames-flora.json") as file:
+            mzNames = json.load(file)
+
+    print("Metazooa scientific names loaded")
+
+    if useCache:
+        # Convert the dumps once, later runs just map the cache
+        cache = openTaxCache("names.dmp", "nodes.dmp")
+
+        print("Taxonomic cache opened")
+
+        # Link taxonomic IDs to metazooa species
+        unresolved, ambiguous = linkSpeciesCached(cache, mzNames)
+
+        print("Taxonomic names linked")
+
+        parents = cache.parents
+    else:
+        # Link taxonomic IDs to metazooa species
+        unresolved, ambiguous = linkSpecies("names.dmp", mzNames)
+
+        print("Taxonomic names linked")
+
+        # Load the parent of every taxonomic node
+        parents = loadParents("nodes.dmp")
+
+    reportLinks(mzNames, unresolved, ambiguous)
+
+    print("Taxonomic nodes linked")
+
+    # Start with the root, all animals start with id 1
+    root = treeNode(1)
+
+    # For each metazooa species
+    lineage: set[int] = set()
+    for mzSpecies in mzNames["species"]:
+        # Species not in the taxdump were reported above
+        if "tax_id" not in mzSpecies:
+            continue
+
+        # Create a chain of tax_ids for this species where each ID is the parent of the next one
+        tax_id = mzSpecies["tax_id"]
+        tax_id_chain = []
+        while True:
+            tax_id_chain.append(tax_id)
+            if tax_id == 1:
+                break
+            else:
+                tax_id = parents[tax_id]
+        tax_id_chain.reverse()
+
+        # Add the tax_id chain to the tree
+        root.addToTree(tax_id_chain)
+        lineage.update(tax_id_chain)
+
+    print("Taxonomic tree created")
+
+    # Compress the tree to remove redundant data
+    # root.compressTree()
+
+    print("Taxonomic tree compressed")
+
+    # Only the names of nodes in the tree are needed
+    if useCache:
+        nameDict = {tax_id: fixSciName(cache.sciName(tax_id)) for tax_id in lineage}
+    else:
+        nameDict = loadSciNames("names.dmp", lineage)
 
+    print("Taxonomic names loaded")
+
+    # Add names to the nodes in the tree
+    speciesNames = speciesByTaxId(mzNames)
+    root.addNamesToTree(nameDict, speciesNames)
+
+    print("Taxonomic tree named")
+
+    # Print the tree to tree.dot
+    with open("tree.dot", "w") as file:
+        file.write("digraph g {\n")
+        root.printTreeDot(file, speciesNames)
         file.write("}\n")
 
+    print("DOT file generated")
 
-useMetazooa = True
-if 1 < len(sys.argv):
-    if "metaflora" == sys.argv[1].lower():
-        useMetazooa = False
-
-# Read a list of all scientific names for metazooa species
-if useMetazooa:
-    with open("sciNames.json") as file:
-        mzNames = json.load(file)
-else:
-    with open("sciNames-flora.json") as file:
-        mzNames = json.load(file)
-
-print("Metazooa scientific names loaded")
-
-# Load a dictionary of all taxonomic names
-nameDict: dict[int, str] = {}
-linesProc = 0
-with open("names.dmp") as file:
-    for line in file:
-        tn = taxName(line)
-
-        # Fix lemons and limes
-        if "Citrus x limon" == tn.name_txt:
-            tn.name_txt = "Citrus limon"
-        if "Citrus x aurantiifolia" == tn.name_txt:
-            tn.name_txt = "Citrus aurantiifolia"
-
-        if tn.name_class == "scientific name":
-            nameDict[tn.tax_id] = tn.name_txt
-
-        # Progress
-        linesProc = linesProc + 1
-        if 0 == linesProc % 1000000:
-            print(str(linesProc) + " lines processed")
-
-print("Taxonomic names loaded")
-
-# Link taxonomic IDs to metazooa species
-for mzName in mzNames["species"]:
-    mzSciName = mzName["sciName"]
-    for key in nameDict.keys():
-        if nameDict[key] == mzSciName:
-            mzName["tax_id"] = key
-            break
-
-print("Taxonomic names linked")
-
-# Load an array of all taxonomic nodes
-nodeDict: dict[int, taxNode] = {}
-# Get a list of all unique rank values
-linesProc = 0
-with open("nodes.dmp") as file:
-    for line in file:
-        # Read the node and set the name from the dict
-        tn = taxNode(line)
-        tn.setSciName(nameDict[tn.tax_id])
-        # add it
-        nodeDict[tn.tax_id] = tn
-
-        # Progress
-        linesProc = linesProc + 1
-        if 0 == linesProc % 1000000:
-            print(str(linesProc) + " lines processed")
-
-print("Taxonomic nodes linked")
-
-# Start with the root, all animals start with id 1
-root = treeNode(1)
-
-# For each metazooa species
-for mzSpecies in mzNames["species"]:
-    # Create a chain of tax_ids for this species where each ID is the parent of the next one
-    tax_id = mzSpecies["tax_id"]
-    tax_id_chain = []
-    while True:
-        tax_id_chain.insert(0, tax_id)
-        if tax_id == 1:
-            break
-        else:
-            tax_id = nodeDict[tax_id].parent_tax_id
-
-    # Add the tax_id chain to the tree
-    root.addToTree(tax_id_chain)
-
-print("Taxonomic tree created")
-
-# Compress the tree to remove redundant data
-# root.compressTree()
-
-print("Taxonomic tree compressed")
-
-# Add names to the nodes in the tree
-root.addNamesToTree(nameDict, mzNames)
-
-print("Taxonomic tree named")
-
-# Print the tree to tree.dot
-with open("tree.dot", "w") as file:
-    file.write("digraph g {\n")
-    root.printTreeDot(file)
-    file.write("}\n")
-
-print("DOT file generated")
-
-if useMetazooa:
-    with open("tree.json", "w") as file:
-        root.printTreeJson(file)
-else:
-    with open("tree-flora.json", "w") as file:
+    if useMetazooa:
+        jsonFilename = "tree.json"
+    else:
+        jsonFilename = "tree-flora.json"
+    with open(jsonFilename, "w") as file:
         root.printTreeJson(file)
 
-print("JSON file generated")
+    print("JSON file generated")
+
+    # Write the binary tree the solver loads, tied to this JSON by its hash
+    with open(jsonFilename, "rb") as file:
+        jsonHash = hashlib.sha256(file.read()).digest()
+    root.toIndex().writeBinary(os.path.splitext(jsonFilename)[0] + ".bin", jsonHash)
+
+    print("Binary file generated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import os
+import struct
+import sys
+from array import array
+
+# Binary tree files start with this, then the header fields in binaryHeader
+binaryMagic = b"MZTREE01"
+binaryHeader = struct.Struct("<8sII32s")
+
+
+class treeIndex:
+    def __init__(
+        self,
+        parent: list[int],
+        names: list[str],
+        taxIds: list[str],
+        leafCount: list[int] = None,
+        exit: list[int] = None,
+        leafLo: list[int] = None,
+    ) -> None:
+        """Compile a taxonomic tree into flat arrays indexed by integer node ID
+
+        Node IDs must be assigned in preorder, i.e. every node comes after its
+        parent and a node's descendants directly follow it. With that ordering
+        a node's Euler-tour entry index is its own ID and its whole subtree is
+        the contiguous ID range [entry, exit).
+
+        Args:
+            parent (list[int]): The parent ID of each node, -1 for the root
+            names (list[str]): The name of each node
+            taxIds (list[str]): The taxonomic ID of each node, as written in tree.json
+            leafCount (list[int], optional): Precomputed leaves under each node. Defaults to None.
+            exit (list[int], optional): Precomputed end of each node's subtree. Defaults to None.
+            leafLo (list[int], optional): Precomputed leaf rank each node's leaves start at. Defaults to None.
+        """
+        n = len(parent)
+        self.n = n
+        self.parent = parent
+        self.names = names
+        self.taxIds = taxIds
+
+        # Link children, walking backwards so the first child ends up first
+        self.firstChild = [-1] * n
+        self.nextSibling = [-1] * n
+        for i in range(n - 1, 0, -1):
+            p = parent[i]
+            self.nextSibling[i] = self.firstChild[p]
+            self.firstChild[p] = i
+
+        if leafCount is None or exit is None or leafLo is None:
+            leafCount, exit, leafLo = self.computeIntervals()
+        self.leafCount = leafCount
+        self.entry = range(n)
+        self.exit = exit
+        self.leafLo = leafLo
+        self.leafHi = [leafLo[i] + leafCount[i] for i in range(n)]
+
+        # Leaves in preorder, a node's are leaves[leafLo:leafHi]
+        self.leaves = [i for i in range(n) if -1 == self.firstChild[i]]
+
+        # Case-folded name lookup. Names aren't unique (genus "Gorilla" and
+        # species "gorilla") so every ID is kept, in preorder
+        self.nameToIds: dict[str, list[int]] = {}
+        for i, name in enumerate(names):
+            self.nameToIds.setdefault(name.lower(), []).append(i)
+
+    def computeIntervals(self) -> tuple[list[int], list[int], list[int]]:
+        """Compute leaf counts and Euler-tour intervals from the parent array
+
+        Returns:
+            tuple[list[int], list[int], list[int]]: The leaves under each node,
+                the end of each node's subtree, and the rank of each node's first leaf
+        """
+        n = self.n
+        parent = self.parent
+
+        # Subtree sizes and leaf counts, accumulated from the bottom up
+        size = [1] * n
+        leafCount = [0] * n
+        for i in range(n - 1, -1, -1):
+            if -1 == self.firstChild[i]:
+                leafCount[i] = leafCount[i] + 1
+            if 0 < i:
+                size[parent[i]] = size[parent[i]] + size[i]
+                leafCount[parent[i]] = leafCount[parent[i]] + leafCount[i]
+
+        # Euler-tour intervals, a node's subtree is [entry, exit)
+        exit = [i + size[i] for i in range(n)]
+
+        # The contiguous range of leaf ranks under each node starts here
+        leafLo = [0] * n
+        leavesSeen = 0
+        for i in range(n):
+            leafLo[i] = leavesSeen
+            if -1 == self.firstChild[i]:
+                leavesSeen = leavesSeen + 1
+
+        return leafCount, exit, leafLo
+
+    @classmethod
+    def fromJson(cls, tree: dict, nodes: list = None):
+        """Compile a tree loaded from tree.json
+
+        Args:
+            tree (dict): The root node of the tree, with name, id and optional children
+            nodes (list, optional): If given, each node's dict is appended in ID order. Defaults to None.
+
+        Returns:
+            treeIndex: The compiled index
+        """
+        parent: list[int] = []
+        names: list[str] = []
+        taxIds: list[str] = []
+        stack = [(tree, -1)]
+        while stack:
+            node, p = stack.pop()
+            if nodes is not None:
+                nodes.append(node)
+            parent.append(p)
+            names.append(node["name"])
+            taxIds.append(node["id"])
+            if "children" in node.keys():
+                me = len(parent) - 1
+                for child in reversed(node["children"]):
+                    stack.append((child, me))
+        return cls(parent, names, taxIds)
+
+    def writeBinary(self, filename: str, sourceHash: bytes = bytes(32)):
+        """Write the index as a compact binary file that fromBinary loads with one read
+
+        After the header come little-endian int32 arrays of the parent, tax_id,
+        leaf count, subtree end and first leaf rank of each node, uint32 offsets
+        of each name in the name table, and then the UTF-8 name table.
+
+        Args:
+            filename (str): The file to write
+            sourceHash (bytes, optional): The SHA-256 of the tree file this was built from. Defaults to zeros.
+        """
+        encoded = [name.encode() for name in self.names]
+        offsets = [0]
+        for name in encoded:
+            offsets.append(offsets[-1] + len(name))
+        blob = b"".join(encoded)
+
+        # Moved into place once written, so an interrupted write can't leave a
+        # file whose header still matches
+        tmpFile = filename + ".tmp"
+        with open(tmpFile, "wb") as file:
+            file.write(binaryHeader.pack(binaryMagic, self.n, len(blob), sourceHash))
+            for values, typecode in (
+                (self.parent, "i"),
+                ([int(t) for t in self.taxIds], "i"),
+                (self.leafCount, "i"),
+                (self.exit, "i"),
+                (self.leafLo, "i"),
+                (offsets, "I"),
+            ):
+                values = array(typecode, values)
+                if "big" == sys.byteorder:
+                    values.byteswap()
+                file.write(values.tobytes())
+            file.write(blob)
+        os.replace(tmpFile, filename)
+
+    @classmethod
+    def fromBinary(cls, filename: str, sourceHash: bytes = None):
+        """Load an index written by writeBinary
+
+        Args:
+            filename (str): The file to load
+            sourceHash (bytes, optional): If given, the SHA-256 the file must have been built from. Defaults to None.
+
+        Returns:
+            treeIndex: The index, or None if the file is from a different tree file or cut short
+        """
+        with open(filename, "rb") as file:
+            data = file.read()
+        try:
+            magic, n, blobLen, fileHash = binaryHeader.unpack_from(data)
+        except struct.error:
+            return None
+        if binaryMagic != magic:
+            raise ValueError(filename + " is not a binary tree file")
+        if sourceHash is not None and sourceHash != fileHash:
+            return None
+        # Five int32 columns, n + 1 name offsets, then the name table
+        if len(data) != binaryHeader.size + 5 * 4 * n + 4 * (n + 1) + blobLen:
+            return None
+
+        pos = binaryHeader.size
+        columns = []
+        for length, typecode in ((n, "i"),) * 5 + ((n + 1, "I"),):
+            values = array(typecode)
+            values.frombytes(data[pos : pos + 4 * length])
+            if "big" == sys.byteorder:
+                values.byteswap()
+            columns.append(values.tolist())
+            pos = pos + 4 * length
+        parent, taxIds, leafCount, exit, leafLo, offsets = columns
+
+        blob = data[pos : pos + blobLen]
+        names = [blob[offsets[i] : offsets[i + 1]].decode() for i in range(n)]
+        return cls(parent, names, [str(t) for t in taxIds], leafCount, exit, leafLo)
+
+    def children(self, node: int):
+        """Iterate over the children of a node
+
+        Args:
+            node (int): The node ID
+
+        Yields:
+            int: Each child ID, in tree order
+        """
+        child = self.firstChild[node]
+        while -1 != child:
+            yield child
+            child = self.nextSibling[child]
+
+    def isLeaf(self, node: int) -> bool:
+        return -1 == self.firstChild[node]
+
+    def contains(self, ancestor: int, node: int) -> bool:
+        """Check if a node is in the subtree of another, including the node itself
+
+        Args:
+            ancestor (int): The root of the subtree
+            node (int): The node to check
+
+        Returns:
+            bool: True if node is in the subtree of ancestor
+        """
+        return self.entry[ancestor] <= self.entry[node] < self.exit[ancestor]
+
+    def lca(self, a: int, b: int) -> int:
+        """Find the lowest common ancestor of two nodes
+
+        Args:
+            a (int): One node
+            b (int): The other node
+
+        Returns:
+            int: The deepest node containing both a and b
+        """
+        while not self.contains(a, b):
+            a = self.parent[a]
+        return a
+
+    def childToward(self, ancestor: int, node: int) -> int:
+        """Find the child of ancestor that leads to node
+
+        Args:
+            ancestor (int): A strict ancestor of node
+            node (int): The node to lead to
+
+        Returns:
+            int: The child of ancestor whose subtree contains node
+        """
+        while self.parent[node] != ancestor:
+            node = self.parent[node]
+        return node
+
+    def path(self, ancestor: int, node: int) -> list[int]:
+        """Get the IDs from ancestor down to node, inclusive
+
+        Args:
+            ancestor (int): An ancestor of node, or node itself
+            node (int): The node to end at
+
+        Returns:
+            list[int]: The IDs from ancestor to node
+        """
+        ids = [node]
+        while node != ancestor:
+            node = self.parent[node]
+            ids.append(node)
+        ids.reverse()
+        return ids
+
+    def find(self, name: str, within: int = 0, exact: bool = False) -> int:
+        """Find a node by name inside a subtree
+
+        Args:
+            name (str): The name to find, case-insensitive unless exact is set
+            within (int, optional): The root of the subtree to search. Defaults to 0.
+            exact (bool, optional): Require the name's case to match. Defaults to False.
+
+        Returns:
+            int: The first matching ID in preorder, or -1 if not found
+        """
+        for i in self.nameToIds.get(name.lower(), ()):
+            if self.contains(within, i) and ((not exact) or self.names[i] == name):
+                return i
+        return -1
@@ -0,0 +1,63 @@
+from operator import attrgetter, methodcaller
+
+# Get a node's children, for nodes loaded from tree.json and for treeGen's
+# treeNodes. These run once per node, so they're C calls rather than functions
+dictChildren = methodcaller("get", "children", ())
+nodeChildren = attrgetter("children")
+
+
+def preorder(root, children=dictChildren):
+    """Visit a tree's nodes parents first, with an explicit stack instead of recursion
+
+    The stack holds an iterator over the siblings left at each level, so its
+    size is the tree's depth, and a node's children are read after it's
+    visited, so the visitor may change them.
+
+    Args:
+        root (_type_): The node to start with
+        children (_type_, optional): Gets a node's children. Defaults to dictChildren.
+
+    Yields:
+        _type_: Each node, children in order
+    """
+    stack = [iter((root,))]
+    while stack:
+        for node in stack[-1]:
+            yield node
+            kids = children(node)
+            if kids:
+                stack.append(iter(kids))
+                break
+        else:
+            stack.pop()
+
+
+def walk(root, children=dictChildren):
+    """Enter and leave a tree's nodes depth first, for writers that open and close each node
+
+    Nodes without children are left as soon as they're entered, so they're
+    only entered.
+
+    Args:
+        root (_type_): The node to start with
+        children (_type_, optional): Gets a node's children. Defaults to dictChildren.
+
+    Yields:
+        tuple: Each node, and its children when entering it or None when leaving it
+    """
+    kids = children(root)
+    yield root, kids
+    if not kids:
+        return
+    stack = [(root, iter(kids))]
+    while stack:
+        parent, siblings = stack[-1]
+        for node in siblings:
+            kids = children(node)
+            yield node, kids
+            if kids:
+                stack.append((node, iter(kids)))
+                break
+        else:
+            stack.pop()
+            yield parent, None